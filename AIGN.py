@@ -1,21 +1,143 @@
+import gzip
+import itertools
+import json
 import os
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from AIGN_Context import ContextBuilder, TokenCounter
+from AIGN_Journal import RECORD_FIELDS, NovelJournal
+from AIGN_Memory import MemoryLedger, MemoryWorker, StoryMemory
 from AIGN_Prompt import *
+from AIGN_Quality import CandidateScorer, RepetitionDetector
+from AIGN_Retrieval import PassageIndex, splitPassages
+from AIGN_Retry import ParseError, Retryer, getBreaker
 
 
-def Retryer(func, max_retries=10):
-    def wrapper(*args, **kwargs):
-        for _ in range(max_retries):
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                print("-" * 30 + f"\n失败：\n{e}\n" + "-" * 30)
-                time.sleep(2.333)
-        raise ValueError("失败")
+class MarkdownStreamParser:
+    """
+    增量解析类md格式中 # key 的内容
+    - feed 接收模型输出的增量文本，每当一个 # key 部分结束（遇到下一个 # key）就立即调用 on_section(key, value)
+    - 开头迟迟没有出现 # key 时会提前报错，不必等模型输出完
+    - 遇到 # END 后 feed 返回 True，调用方不必再解析之后的内容；未解析全部 output_keys 时由 close 报错
+    """
+
+    def __init__(self, output_keys=(), on_section=None, max_preamble=500):
+        self.output_keys = list(output_keys)
+        self.on_section = on_section
+        self.max_preamble = max_preamble
+
+        self.chunks = []
+        self.buffer = ""
+        self.preamble_length = 0
+        self.current_section = ""
+        self.sections = {}
+        self.done = False
+
+    def feed(self, delta: str) -> bool:
+        self.chunks.append(delta)
+        self.buffer += delta
+        if "\n" in delta:
+            *lines, self.buffer = self.buffer.split("\n")
+            for line in lines:
+                self.feedLine(line)
+        return self.done
+
+    def feedLine(self, line: str):
+        if line.startswith("# ") or line.startswith(" # "):
+            # new key
+            self.closeSection()
+            self.current_section = line[2:].strip()
+            self.sections[self.current_section] = []
+            if self.current_section == "END":
+                self.done = True
+        elif self.current_section:
+            # add content to current key
+            self.sections[self.current_section].append(line.strip())
+        else:
+            self.preamble_length += len(line)
+            if self.preamble_length > self.max_preamble:
+                raise ParseError(f"no section found in output:\n{self.output}\n\n")
+
+    def closeSection(self):
+        if self.current_section not in ("", "END") and self.on_section:
+            value = "\n".join(self.sections[self.current_section]).strip()
+            self.on_section(self.current_section, value)
+
+    def check(self):
+        missing = [
+            k
+            for k in self.output_keys
+            if (k not in self.sections) or (len(self.getSection(k)) == 0)
+        ]
+        if missing:
+            raise ParseError(
+                f"fail to parse {missing[0]} in output:\n{self.output}\n\n",
+                sections=self.getSections(),
+                missing=missing,
+            )
+
+    def getSection(self, key):
+        return "\n".join(self.sections[key]).strip()
+
+    def close(self) -> dict:
+        """输出结束，返回全部解析结果，未解析全部output_keys中的key会报错"""
+        if self.buffer:
+            self.feedLine(self.buffer)
+            self.buffer = ""
+        self.closeSection()
+        self.check()
+        return self.getSections()
+
+    def getSections(self) -> dict:
+        return {key: self.getSection(key) for key in self.sections}
+
+    @property
+    def output(self):
+        return "".join(self.chunks)
+
+
+class NovelText:
+    """
+    按段落分块保存的小说正文
+    - append 为 O(1)，不会重新拼接全文
+    - text 在被读取时才拼接，并缓存到下一次 append
+    - 总字数与每段在全文中的起始位置随 append 维护
+    """
+
+    def __init__(self, paragraphs=()):
+        self.paragraphs = []
+        self.offsets = []
+        self.length = 0
+        self.joined = ""
+
+        for paragraph in paragraphs:
+            self.append(paragraph)
+
+    def append(self, paragraph: str):
+        self.paragraphs.append(paragraph)
+        self.offsets.append(self.length)
+        self.length += len(paragraph) + 2
+        self.joined = None
+
+    @property
+    def text(self) -> str:
+        if self.joined is None:
+            self.joined = "".join(f"{paragraph}\n\n" for paragraph in self.paragraphs)
+        return self.joined
+
+    def __len__(self):
+        return self.length
+
+
+# 在多次请求间不变（或很少变化）的输入，invoke 时按此顺序排在最前面，越靠前越稳定
+# 其余输入按原顺序排在后面，使请求开头尽量相同，便于命中服务商的前缀缓存
+STABLE_INPUT_KEYS = ["小说大纲", "大纲", "用户想法", "用户要求", "润色要求", "前文记忆"]
 
-    return wrapper
+
+USAGE_KEYS = ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")
 
 
 class MarkdownAgent:
@@ -32,14 +154,38 @@ class MarkdownAgent:
         first_replay="明白了。",
         # first_replay=None,
         is_speak=True,
+        stream=False,
+        cache=None,
+        max_repairs=1,
+        metrics=None,
+        pin_keys=(),
     ) -> None:
+        """
+        cache 为 ResponseCache 时，相同输入的请求直接复用已缓存的回复
+        max_repairs 为回复缺少部分 # key 时，只追问缺少部分的次数，仍失败才整体重新生成
+        metrics 为 MetricsRecorder 时，每次 invoke 记录 token 用量、首 token 延迟、耗时与重试次数
+        pin_keys 中的输入（例如大纲）作为固定的一轮对话放在系统提示词之后，
+        与系统提示词一起构成逐字节不变的请求开头，便于命中服务商的前缀缓存
+        invoke 的参数与 chatLLM、cache、metrics 覆盖只保存在当前线程中，use_memory 为 False 的 agent
+        没有其他状态，可以由多个会话共用，见 getAgent
+        """
 
+        # 路由 chatLLM 可以按 agent 选择后端
+        if hasattr(chatLLM, "for_agent"):
+            chatLLM = chatLLM.for_agent(name)
         self.chatLLM = chatLLM
         self.sys_prompt = sys_prompt
+        self.name = name
         self.temperature = temperature
         self.top_p = top_p
         self.use_memory = use_memory
         self.is_speak = is_speak
+        self.stream = stream
+        self.cache = cache
+        self.max_repairs = max_repairs
+        self.metrics = metrics
+        self.pin_keys = list(pin_keys)
+        self.local = threading.local()
 
         self.history = [{"role": "user", "content": self.sys_prompt}]
 
@@ -50,42 +196,183 @@ class MarkdownAgent:
             self.history.append({"role": "assistant", "content": resp["content"]})
             # if self.is_speak:
             #     self.speak(Msg(self.name, resp["content"]))
+        self.first_replay = self.history[-1]["content"]
+        self.base_history = list(self.history)
+
+    def getChatLLM(self):
+        """当前 invoke 指定的 chatLLM，没有指定时为创建时的 chatLLM"""
+        return getattr(self.local, "chatLLM", None) or self.chatLLM
+
+    def getCache(self):
+        """当前 invoke 指定的 cache，没有指定时为创建时的 cache"""
+        cache = getattr(self.local, "cache", None)
+        return self.cache if cache is None else cache
+
+    def getMetrics(self):
+        """当前 invoke 指定的 metrics，没有指定时为创建时的 metrics"""
+        metrics = getattr(self.local, "metrics", None)
+        return self.metrics if metrics is None else metrics
+
+    def getHistory(self) -> list:
+        """系统提示词、当前 invoke 中固定的输入（pin_keys），以及 use_memory 时之前的对话"""
+        history = list(self.base_history)
+        pinned = getattr(self.local, "pinned", None)
+        if pinned:
+            content = "".join(f"# {k}\n{v}\n\n" for k, v in pinned.items())
+            history.append({"role": "user", "content": content})
+            history.append({"role": "assistant", "content": self.first_replay})
+        return history + self.history[len(self.base_history) :]
+
+    def query(self, user_input: str, on_delta=None) -> str:
+        """on_delta 不为空时以流式请求，每收到一段增量文本就调用 on_delta(delta)，其返回 True 时提前结束接收"""
+        messages = self.getHistory() + [{"role": "user", "content": user_input}]
+        resp = self.chat(messages, on_delta)
 
-    def query(self, user_input: str) -> str:
-        resp = self.chatLLM(
-            messages=self.history + [{"role": "user", "content": user_input}],
-            temperature=self.temperature,
-            top_p=self.top_p,
-        )
         if self.use_memory:
             self.history.append({"role": "user", "content": user_input})
             self.history.append({"role": "assistant", "content": resp["content"]})
 
         return resp
 
-    def getOutput(self, input_content: str, output_keys: list) -> dict:
-        """解析类md格式中 # key 的内容，未解析全部output_keys中的key会报错"""
-        resp = self.query(input_content)
-        output = resp["content"]
-
-        lines = output.split("\n")
-        sections = {}
-        current_section = ""
-        for line in lines:
-            if line.startswith("# ") or line.startswith(" # "):
-                # new key
-                current_section = line[2:].strip()
-                sections[current_section] = []
+    def chat(self, messages: list, on_delta=None) -> dict:
+        stats = self.getStats()
+        request_start = time.time()
+        chatLLM = self.getChatLLM()
+        if on_delta is None:
+            resp = chatLLM(
+                messages=messages,
+                temperature=self.temperature,
+                top_p=self.top_p,
+            )
+            stats["ttft"] = time.time() - request_start
+            self.addUsage(stats, resp)
+            return resp
+
+        # 支持的 chatLLM 只输出增量，每个分块的处理开销与已输出的长度无关
+        delta_mode = getattr(chatLLM, "supports_delta", False)
+        kwargs = {"delta": True} if delta_mode else {}
+        resp = {"content": ""}
+        usage = {}
+        deltas = []
+        done = False
+        stats["ttft"] = None
+        try:
+            for chunk in chatLLM(
+                messages=messages,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                stream=True,
+                **kwargs,
+            ):
+                # token 用量通常在 # END 之后的最后一个分块中，解析结束后仍读到流结束
+                usage.update({k: v for k, v in chunk.items() if k in USAGE_KEYS and v})
+                if delta_mode:
+                    delta = chunk["delta"]
+                    deltas.append(delta)
+                else:
+                    delta = chunk["content"][len(resp["content"]) :]
+                resp = chunk
+                if delta and stats["ttft"] is None:
+                    stats["ttft"] = time.time() - request_start
+                if delta and not done:
+                    done = on_delta(delta)
+        finally:
+            # 解析出错提前结束时也记下已收到的用量
+            self.addUsage(stats, usage)
+        if delta_mode:
+            resp["content"] = "".join(deltas)
+        resp.update(usage)
+        return resp
+
+    @staticmethod
+    def addUsage(stats, resp):
+        for k in USAGE_KEYS:
+            stats[k] += resp.get(k) or 0
+
+    def getStats(self) -> dict:
+        """当前线程正在进行的 invoke 的统计"""
+        stats = getattr(self.local, "stats", None)
+        if stats is None:
+            stats = self.newStats()
+        return stats
+
+    @staticmethod
+    def newStats() -> dict:
+        return {
+            "attempts": 0,
+            "cached": False,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "cached_tokens": 0,
+            "ttft": None,
+        }
+
+    def getOutput(
+        self,
+        input_content: str,
+        output_keys: list,
+        on_section=None,
+        use_cache=True,
+        validate=None,
+    ) -> dict:
+        """
+        解析类md格式中 # key 的内容，未解析全部output_keys中的key会报错
+        stream 为 True 或传入 on_section 时边生成边解析，on_section(key, value) 在每个部分结束时被调用
+        use_cache 为 False 时不读写缓存，例如同一输入需要多个不同回复时
+        validate(sections) 抛出 ParseError 时该回复作废并重新生成，也不会写入缓存
+        """
+        stats = self.getStats()
+        stats["attempts"] += 1
+
+        cache = self.getCache()
+        cache_key = None
+        if cache is not None and use_cache:
+            cache_key = cache.makeKey(
+                self.sys_prompt,
+                self.getHistory() + [{"role": "user", "content": input_content}],
+                self.temperature,
+                self.top_p,
+                getattr(self.getChatLLM(), "model_name", None),
+            )
+            content = cache.get(cache_key)
+            if content is not None:
+                try:
+                    sections = self.parse(content, output_keys, on_section)
+                    if validate is not None:
+                        validate(sections)
+                except ParseError:
+                    cache.delete(cache_key)
+                else:
+                    if self.use_memory:
+                        self.history.append({"role": "user", "content": input_content})
+                        self.history.append({"role": "assistant", "content": content})
+                    stats["cached"] = True
+                    return sections
+
+        history = self.getHistory()
+        parser = MarkdownStreamParser(output_keys, on_section)
+        try:
+            if self.stream or on_section:
+                self.query(input_content, on_delta=parser.feed)
             else:
-                # add content to current key
-                if current_section:
-                    sections[current_section].append(line.strip())
-        for key in sections.keys():
-            sections[key] = "\n".join(sections[key]).strip()
+                resp = self.query(input_content)
+                parser.feed(resp["content"])
+            sections = parser.close()
+            content = parser.output
+        except ParseError as e:
+            # 已解析出部分内容时，只追问缺少的部分，而不是整体重新生成
+            if not (self.max_repairs and e.sections and e.missing):
+                raise
+            sections = self.repair(
+                history, input_content, parser.output, e, on_section
+            )
+            content = self.renderSections(sections)
 
-        for k in output_keys:
-            if (k not in sections) or (len(sections[k]) == 0):
-                raise ValueError(f"fail to parse {k} in output:\n{output}\n\n")
+        if validate is not None:
+            validate(sections)
+        if cache_key is not None:
+            cache.put(cache_key, content)
 
         # if self.is_speak:
         #     self.speak(
@@ -96,71 +383,427 @@ class MarkdownAgent:
         #     )
         return sections
 
-    def invoke(self, inputs: dict, output_keys: list) -> dict:
+    def repair(self, history, input_content, output, error, on_section=None) -> dict:
+        """把缺少的 # key 发回给模型补全，并与已解析的部分合并"""
+        sections = dict(error.sections)
+        missing = error.missing
+        messages = history + [
+            {"role": "user", "content": input_content},
+            {"role": "assistant", "content": output},
+        ]
+        for _ in range(self.max_repairs):
+            missing_format = "\n".join(f"# {k}\n..." for k in missing)
+            repair_prompt = (
+                f"你的回复缺少以下部分：{'、'.join(missing)}\n"
+                "请只输出缺少的部分，不要重复已经输出的内容，以固定格式输出：\n"
+                f"```\n{missing_format}\n# END\n```"
+            )
+            resp = self.chat(
+                messages + [{"role": "user", "content": repair_prompt}]
+            )
+            try:
+                repaired = self.parse(resp["content"], missing, on_section)
+                sections.update({k: repaired[k] for k in missing})
+                return sections
+            except ParseError as e:
+                sections.update(
+                    {k: v for k, v in e.sections.items() if k in missing and v}
+                )
+                missing = e.missing or missing
+                error = e
+        raise error
+
+    @staticmethod
+    def renderSections(sections: dict) -> str:
+        content = ""
+        for k, v in sections.items():
+            if k != "END":
+                content += f"# {k}\n{v}\n"
+        return content + "# END\n"
+
+    def parse(self, content: str, output_keys: list, on_section=None) -> dict:
+        parser = MarkdownStreamParser(output_keys, on_section)
+        parser.feed(content)
+        return parser.close()
+
+    def invoke(
+        self,
+        inputs: dict,
+        output_keys: list,
+        on_section=None,
+        use_cache=True,
+        validate=None,
+        chatLLM=None,
+        cache=None,
+        metrics=None,
+    ) -> dict:
+        """chatLLM、cache、metrics 不为空时本次调用使用它们代替创建时的对象"""
+        pinned = {
+            k: inputs[k]
+            for k in self.pin_keys
+            if isinstance(inputs.get(k), str) and len(inputs[k]) > 0
+        }
         input_content = ""
-        for k, v in inputs.items():
-            if isinstance(v, str) and len(v) > 0:
+        for k in self.orderKeys(inputs):
+            v = inputs[k]
+            if k not in pinned and isinstance(v, str) and len(v) > 0:
                 input_content += f"# {k}\n{v}\n\n"
 
-        result = Retryer(self.getOutput)(input_content, output_keys)
+        # 路由 chatLLM 可以按 agent 选择后端
+        if hasattr(chatLLM, "for_agent"):
+            chatLLM = chatLLM.for_agent(self.name)
+        self.local.chatLLM = chatLLM
+        self.local.cache = cache
+        self.local.metrics = metrics
+        self.local.pinned = pinned
+        self.local.stats = stats = self.newStats()
+        chatLLM = self.getChatLLM()
+        metrics = self.getMetrics()
+        start = time.time()
+        error = None
+        try:
+            result = Retryer(
+                self.getOutput,
+                breaker=getBreaker(getattr(chatLLM, "provider", None)),
+            )(input_content, output_keys, on_section, use_cache, validate)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.local.stats = None
+            self.local.chatLLM = None
+            self.local.cache = None
+            self.local.metrics = None
+            self.local.pinned = None
+            if metrics is not None:
+                metrics.record(
+                    {
+                        "time": start,
+                        "agent": self.name,
+                        "model": getattr(chatLLM, "model_name", None),
+                        "latency": time.time() - start,
+                        "retries": max(stats["attempts"] - 1, 0),
+                        "error": repr(error) if error else None,
+                        **stats,
+                    }
+                )
 
         return result
 
+    @staticmethod
+    def orderKeys(inputs: dict) -> list:
+        """稳定的输入在前，每次都变化的输入在后"""
+        stable = [k for k in STABLE_INPUT_KEYS if k in inputs]
+        return stable + [k for k in inputs if k not in STABLE_INPUT_KEYS]
+
     def clear_memory(self):
         if self.use_memory:
-            self.history = self.history[:2]
+            self.history = list(self.base_history)
+
+
+agents = {}
+agents_lock = threading.Lock()
+
+
+def getAgent(sys_prompt: str, name: str, **kwargs) -> MarkdownAgent:
+    """
+    参数相同的会话共用同一个 MarkdownAgent，新建会话时不必重复创建
+    共用的 agent 只按不可变的参数区分，不绑定 chatLLM、cache、metrics，
+    通过 BoundAgent 或 invoke(chatLLM=..., cache=..., metrics=...) 按会话指定；
+    use_memory 的 agent 有各自的对话历史，不能共用
+    """
+    if kwargs.get("use_memory"):
+        raise ValueError(f"{name} 使用 use_memory，不能共用")
+    for k in ("cache", "metrics"):
+        if kwargs.get(k) is not None:
+            raise ValueError(f"共用的 agent 不能绑定 {k}，请通过 BoundAgent 指定")
+    key = (sys_prompt, name, tuple(sorted(kwargs.items())))
+    with agents_lock:
+        if key not in agents:
+            agents[key] = MarkdownAgent(None, sys_prompt, name, **kwargs)
+        return agents[key]
+
+
+class BoundAgent:
+    """
+    共用的 agent 加上本会话的 chatLLM、cache、metrics，修改它们只影响本会话
+    只能通过 invoke 调用，query、chat 等请求方法不经过 invoke 就没有本会话的 chatLLM，因此不开放
+    """
+
+    REQUEST_METHODS = ("query", "chat", "getOutput", "repair")
+
+    def __init__(self, agent: MarkdownAgent, chatLLM, cache=None, metrics=None):
+        self.agent = agent
+        self.chatLLM = chatLLM
+        self.cache = cache
+        self.metrics = metrics
+
+    def invoke(
+        self,
+        inputs: dict,
+        output_keys: list,
+        on_section=None,
+        use_cache=True,
+        validate=None,
+    ) -> dict:
+        return self.agent.invoke(
+            inputs,
+            output_keys,
+            on_section,
+            use_cache,
+            validate,
+            chatLLM=self.chatLLM,
+            cache=self.cache,
+            metrics=self.metrics,
+        )
+
+    def __getattr__(self, name):
+        if name in self.REQUEST_METHODS:
+            raise AttributeError(f"BoundAgent 只能通过 invoke 调用，没有 {name}")
+        return getattr(self.agent, name)
 
 
 class AIGN:
-    def __init__(self, chatLLM):
+    def __init__(
+        self,
+        chatLLM,
+        pipelined=False,
+        cache=None,
+        cache_agents=None,
+        journal_path="novel_record.journal",
+        record_path="novel_record.md",
+        metrics=None,
+        context_budget=None,
+        retrieval_k=0,
+        story_memory=False,
+        memory_ops=False,
+        compact_every=10,
+        max_lag_chars=6000,
+        max_lag_paragraphs=None,
+        candidates=1,
+        scorer=None,
+        repetition=None,
+        max_rejects=2,
+        overwrite_journal=False,
+        stream=False,
+    ):
+        """
+        pipelined 为 True 时 genNextParagraph 以流水线方式运行：
+        润色第 N 段的同时以第 N 段草稿为上文起草第 N+1 段，记忆总结在后台进行
+        cache 为 ResponseCache 时，cache_agents 中列出的 agent（按 name，None 表示全部）复用缓存的回复
+        journal_path 为追加式日志的路径，record_path 的 novel_record.md 由日志定期重建；
+        journal_path 为 None 时每一步都完整重写 record_path
+        journal_path 上已有日志时报错，以免覆盖另一部小说，overwrite_journal 为 True 时才清空重写
+        stream 为 True 时写作 agent 以流式输出并边生成边解析：# 段落 一写完就检查重复（重复时立即放弃本次回复），
+        非流水线模式下同时开始润色（使用写这一段时的计划与临时设定），不等模型写完计划与临时设定
+        metrics 为 MetricsRecorder 时记录每个 agent 每次调用的 token 用量与耗时
+        context_budget 不为空时，写作与润色的提示词按 token 估计控制在该预算之内，
+        上文按 token 而不是字数截取
+        retrieval_k 大于 0 时，从更早的正文与已从记忆中删去的内容里检索与计划相关的 retrieval_k 个片段作为“相关前文”交给写作 agent
+        story_memory 为 True 时记忆以人物、关系、事件的结构保存，模型只输出增量，
+        写作时只提供计划与上文中提到的人物的相关条目
+        memory_ops 为 True 时记忆是带编号的条目，模型只输出增删改操作，
+        每 compact_every 次更新由 memory_maker 整体重写一次，合并零散的条目
+        记忆总结在后台进行，未总结的正文超过 max_lag_chars 字或 max_lag_paragraphs 段时才等待总结完成
+        candidates 大于 1 时写作 agent 并行生成 candidates 个草稿（不使用缓存），
+        由 scorer（默认 CandidateScorer）在本地打分，只把得分最高的草稿交给润色 agent
+        repetition 为 RepetitionDetector（或 True 使用默认参数）时，与前文大量重复的草稿在润色前被退回重写，
+        最多 max_rejects 次，之后仍重复则保留并打印提示
+        """
         self.chatLLM = chatLLM
+        self.context = None
+        if context_budget:
+            self.context = ContextBuilder(
+                TokenCounter(getattr(chatLLM, "provider", None)), context_budget
+            )
+        self.pipelined = pipelined
+        self.stream = stream
+        self.executor = None
+        self.pending_draft = None
+        self.memory_worker = MemoryWorker(
+            self.makeMemory,
+            max_lag_chars=max_lag_chars,
+            max_lag_paragraphs=max_lag_paragraphs,
+            on_update=self.indexDroppedMemory,
+        )
+        if journal_path is not None and not overwrite_journal:
+            if os.path.exists(journal_path) or os.path.exists(journal_path + ".snapshot"):
+                raise FileExistsError(
+                    f"{journal_path} 已有日志，继续写作请用 AIGN.resume，"
+                    "开始新小说请指定 overwrite_journal=True"
+                )
+        self.journal_path = journal_path
+        self.overwrite_journal = overwrite_journal
+        self.record_path = record_path
+        self.journal = None
+        self.retrieval_k = retrieval_k
+        self.index = None
+        self.memory_lines = []
+        self.indexed_memory = set()
+        self.story = StoryMemory() if story_memory else None
+        self.ledger = MemoryLedger() if memory_ops else None
+        self.compact_every = compact_every
+        self.memory_updates = 0
+        self.candidates = candidates
+        self.scorer = scorer or CandidateScorer()
+        self.candidate_executor = None
+        self.candidate_scores = []
+        if repetition is True:
+            repetition = RepetitionDetector()
+        self.repetition = repetition
+        self.max_rejects = max_rejects
+        self.repetition_report = None
 
         self.novel_outline = ""
-        self.paragraph_list = []
-        self.novel_content = ""
+        self.novel_text = NovelText()
         self.writing_plan = ""
         self.temp_setting = ""
-        self.writing_memory = ""
-        self.no_memory_paragraph = ""
         self.user_idea = ""
         self.user_requriments = ""
         self.embellishment_idea = ""
 
-        self.novel_outline_writer = MarkdownAgent(
-            chatLLM=self.chatLLM,
+        self.novel_outline_writer = self.bindAgent(
             sys_prompt=novel_outline_writer_prompt,
             name="NovelOutlineWriter",
             temperature=0.98,
+            cache=self.agentCache(cache, cache_agents, "NovelOutlineWriter"),
+            metrics=metrics,
         )
-        self.novel_beginning_writer = MarkdownAgent(
-            chatLLM=self.chatLLM,
+        self.novel_beginning_writer = self.bindAgent(
             sys_prompt=novel_beginning_writer_prompt,
             name="NovelBeginningWriter",
             temperature=0.80,
+            cache=self.agentCache(cache, cache_agents, "NovelBeginningWriter"),
+            metrics=metrics,
         )
-        self.novel_writer = MarkdownAgent(
-            chatLLM=self.chatLLM,
+        self.novel_writer = self.bindAgent(
             sys_prompt=novel_writer_prompt,
             name="NovelWriter",
             temperature=0.81,
+            cache=self.agentCache(cache, cache_agents, "NovelWriter"),
+            metrics=metrics,
+            pin_keys=("大纲",),
         )
-        self.novel_embellisher = MarkdownAgent(
-            chatLLM=self.chatLLM,
+        self.novel_embellisher = self.bindAgent(
             sys_prompt=novel_embellisher_prompt,
             name="NovelEmbellisher",
             temperature=0.92,
+            cache=self.agentCache(cache, cache_agents, "NovelEmbellisher"),
+            metrics=metrics,
+            pin_keys=("大纲",),
         )
-        self.memory_maker = MarkdownAgent(
-            chatLLM=self.chatLLM,
+        self.memory_maker = self.bindAgent(
             sys_prompt=memory_maker_prompt,
             name="MemoryMaker",
             temperature=0.66,
+            cache=self.agentCache(cache, cache_agents, "MemoryMaker"),
+            metrics=metrics,
+        )
+        self.story_memory_maker = self.bindAgent(
+            sys_prompt=story_memory_maker_prompt,
+            name="StoryMemoryMaker",
+            temperature=0.66,
+            cache=self.agentCache(cache, cache_agents, "StoryMemoryMaker"),
+            metrics=metrics,
+        )
+        self.memory_editor = self.bindAgent(
+            sys_prompt=memory_editor_prompt,
+            name="MemoryEditor",
+            temperature=0.66,
+            cache=self.agentCache(cache, cache_agents, "MemoryEditor"),
+            metrics=metrics,
+        )
+
+    def bindAgent(self, sys_prompt, name, cache=None, metrics=None, **kwargs) -> BoundAgent:
+        return BoundAgent(
+            getAgent(sys_prompt, name, **kwargs), self.chatLLM, cache, metrics
         )
 
+    @staticmethod
+    def agentCache(cache, cache_agents, name):
+        if cache_agents is None or name in cache_agents:
+            return cache
+        return None
+
+    @property
+    def paragraph_list(self):
+        """只读使用，追加段落请用 appendParagraph"""
+        return self.novel_text.paragraphs
+
+    @paragraph_list.setter
+    def paragraph_list(self, paragraph_list):
+        self.novel_text = NovelText(paragraph_list)
+        if self.repetition is not None:
+            self.repetition.reset(paragraph_list)
+        if self.retrieval_k:
+            self.index = PassageIndex()
+            for position, paragraph in enumerate(self.paragraph_list):
+                self.indexText(paragraph, "正文", position)
+
+    def appendParagraph(self, paragraph):
+        self.novel_text.append(paragraph)
+        if self.repetition is not None:
+            self.repetition.add(paragraph)
+        self.indexText(paragraph, "正文", len(self.paragraph_list) - 1)
+
+    def indexText(self, text, source, position=None):
+        """position 为正文的段落序号，记忆没有序号"""
+        if not self.retrieval_k:
+            return
+        if self.index is None:
+            self.index = PassageIndex()
+        for passage in splitPassages(text):
+            self.index.add(passage, source, position)
+
+    def indexDroppedMemory(self, memory):
+        """
+        只索引这次更新从记忆中删去的行，当前记忆已经在写作 agent 的输入里，不需要检索
+        同一行只索引一次，避免记忆反复改写后旧版本占满“相关前文”
+        """
+        dropped = []
+        for line in self.memory_lines:
+            if line not in memory and line not in self.indexed_memory:
+                self.indexed_memory.add(line)
+                dropped.append(line)
+        self.memory_lines = [line.strip() for line in memory.split("\n") if line.strip()]
+        if dropped:
+            self.indexText("\n".join(dropped), "记忆")
+
+    def getRelatedPassages(self, query, context_start):
+        """检索与 query 相关、且不在上文与当前记忆中的片段，上文从第 context_start 段开始"""
+        if not (self.retrieval_k and self.index):
+            return ""
+        writing_memory = self.writing_memory
+        passages = self.index.search(
+            query,
+            k=self.retrieval_k,
+            exclude=lambda text, source: source == "记忆" and text in writing_memory,
+            before=context_start,
+        )
+        return "\n\n".join(f"（{source}）{text}" for _, text, source in passages)
+
+    @property
+    def writing_memory(self):
+        return self.memory_worker.memory
+
+    @writing_memory.setter
+    def writing_memory(self, writing_memory):
+        self.memory_worker.memory = writing_memory
+
+    @property
+    def no_memory_paragraph(self):
+        """尚未总结进记忆的正文，包括正在后台总结的部分"""
+        return self.memory_worker.pending
+
+    @no_memory_paragraph.setter
+    def no_memory_paragraph(self, no_memory_paragraph):
+        self.memory_worker.setPending(no_memory_paragraph)
+
+    @property
+    def novel_content(self):
+        return self.novel_text.text
+
     def updateNovelContent(self):
-        self.novel_content = ""
-        for paragraph in self.paragraph_list:
-            self.novel_content += f"{paragraph}\n\n"
         return self.novel_content
 
     def genNovelOutline(self, user_idea=None):
@@ -171,6 +814,7 @@ class AIGN:
             output_keys=["大纲"],
         )
         self.novel_outline = resp["大纲"]
+        self.recordNovel()
         return self.novel_outline
 
     def genBeginning(self, user_requriments=None, embellishment_idea=None):
@@ -192,33 +836,99 @@ class AIGN:
         self.temp_setting = resp["临时设定"]
 
         resp = self.novel_embellisher.invoke(
-            inputs={
-                "大纲": self.novel_outline,
-                "临时设定": self.temp_setting,
-                "计划": self.writing_plan,
-                "润色要求": self.embellishment_idea,
-                "要润色的内容": beginning,
-            },
+            inputs=self.fitInputs(
+                self.novel_embellisher,
+                {
+                    "大纲": self.novel_outline,
+                    "临时设定": self.temp_setting,
+                    "计划": self.writing_plan,
+                    "润色要求": self.embellishment_idea,
+                    "要润色的内容": beginning,
+                },
+            ),
             output_keys=["润色结果"],
         )
         beginning = resp["润色结果"]
 
-        self.paragraph_list.append(beginning)
-        self.updateNovelContent()
+        self.appendParagraph(beginning)
+        self.recordNovel()
 
         return beginning
 
-    def getLastParagraph(self, max_length=2000):
-        last_paragraph = ""
+    def getLastParagraph(self, max_length=2000, provisional=None):
+        """provisional 为尚未定稿的草稿，会被当作最后一段"""
+        paragraphs = self.selectLastParagraphs(max_length, provisional)
+        return "".join(p + "\n" for p in reversed(paragraphs))
+
+    def selectLastParagraphs(self, max_length=2000, provisional=None):
+        """上文包含的段落，从最后一段开始"""
+        # 从最后一段往前取，不复制段落列表
+        newest_first = reversed(self.paragraph_list)
+        if provisional:
+            newest_first = itertools.chain([provisional], newest_first)
+
+        if self.context is not None:
+            return self.selectLastParagraphsByTokens(newest_first)
 
-        for i in range(0, len(self.paragraph_list)):
-            if (len(last_paragraph) + len(self.paragraph_list[-1 - i])) < max_length:
-                last_paragraph = self.paragraph_list[-1 - i] + "\n" + last_paragraph
+        paragraphs = []
+        length = 0
+        for paragraph in newest_first:
+            if length + len(paragraph) < max_length:
+                paragraphs.append(paragraph)
+                length += len(paragraph) + 1
             else:
                 break
-        return last_paragraph
+        return paragraphs
+
+    def selectLastParagraphsByTokens(self, newest_first):
+        """按 token 预算从后往前截取上文，newest_first 从最后一段开始，已定稿段落的 token 数会被缓存"""
+        counter = self.context.counter
+        max_tokens = self.context.sections["上文内容"]["max_tokens"]
+        paragraphs = []
+        tokens = 0
+        for paragraph in newest_first:
+            paragraph_tokens = counter.count(paragraph)
+            if tokens + paragraph_tokens > max_tokens:
+                if not paragraphs:
+                    paragraphs.append(counter.truncate(paragraph, max_tokens, "tail"))
+                break
+            paragraphs.append(paragraph)
+            tokens += paragraph_tokens
+        return paragraphs
+
+    def fitInputs(self, agent, inputs):
+        """
+        把 agent 的输入控制在 context_budget 之内，系统提示词等固定部分先扣除
+        固定在请求开头的输入（agent.pin_keys）只按单项上限截断，不随其他输入的长短变化
+        """
+        if self.context is None:
+            return inputs
+        pinned = self.context.fit({k: v for k, v in inputs.items() if k in agent.pin_keys})
+        reserved = sum(
+            self.context.counter.count(m["content"]) for m in agent.base_history
+        ) + sum(self.context.counter.count(v) for v in pinned.values() if isinstance(v, str))
+        fitted = self.context.fit(
+            {k: v for k, v in inputs.items() if k not in agent.pin_keys}, reserved
+        )
+        return {k: pinned[k] if k in pinned else fitted[k] for k in inputs}
 
     def recordNovel(self):
+        """只把新段落与有变化的状态追加到日志"""
+        if self.journal_path is None:
+            with open(self.record_path, "w", encoding="utf-8") as f:
+                f.write(self.renderRecord())
+            return
+        if self.journal is None:
+            self.journal = NovelJournal(
+                self.journal_path,
+                record_path=self.record_path,
+                overwrite=self.overwrite_journal,
+            )
+        self.journal.sync(
+            self.paragraph_list, {k: getattr(self, k) for k in RECORD_FIELDS}
+        )
+
+    def renderRecord(self):
         record_content = ""
         record_content += f"# 大纲\n\n{self.novel_outline}\n\n"
         record_content += f"# 正文\n\n"
@@ -226,65 +936,332 @@ class AIGN:
         record_content += f"# 记忆\n\n{self.writing_memory}\n\n"
         record_content += f"# 计划\n\n{self.writing_plan}\n\n"
         record_content += f"# 临时设定\n\n{self.temp_setting}\n\n"
+        return record_content
+
+    def getState(self) -> dict:
+        """当前会话的全部状态，可用 loadState 恢复"""
+        state = {k: getattr(self, k) for k in RECORD_FIELDS}
+        state["paragraphs"] = list(self.paragraph_list)
+        return state
+
+    def loadState(self, state: dict):
+        for k in RECORD_FIELDS:
+            setattr(self, k, state.get(k, ""))
+        self.paragraph_list = state.get("paragraphs", [])
+        if self.story is not None:
+            self.story.loadText(self.writing_memory)
+        if self.ledger is not None:
+            self.ledger.loadText(self.writing_memory)
+        self.memory_lines = []
+        self.indexed_memory = set()
+        self.indexDroppedMemory(self.writing_memory)
+        self.pending_draft = None
 
-        with open("novel_record.md", "w", encoding="utf-8") as f:
-            f.write(record_content)
+    def saveCheckpoint(self, path):
+        """把会话状态保存为 gzip 压缩的 JSON 检查点"""
+        content = gzip.compress(
+            json.dumps(self.getState(), ensure_ascii=False).encode("utf-8")
+        )
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def resume(cls, path, chatLLM, **kwargs):
+        """
+        从检查点或日志恢复会话，从最后一段继续写作
+        - path 为 saveCheckpoint 保存的检查点，恢复的状态以检查点为准，
+          下次保存时 journal_path 上的日志按检查点的状态重写
+        - path 为 journal_path 的日志时，恢复后继续在该日志上追加
+        """
+        with open(path, "rb") as f:
+            is_checkpoint = f.read(2) == b"\x1f\x8b"
+
+        if is_checkpoint:
+            # 崩溃后的日志本来就存在，不能当作要新建的小说检查
+            journal_path = kwargs.pop("journal_path", "novel_record.journal")
+            aign = cls(chatLLM, journal_path=None, **kwargs)
+            aign.journal_path = journal_path
+            aign.overwrite_journal = True
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                aign.loadState(json.load(f))
+        else:
+            # 已有的日志不是要覆盖的对象，创建后再接上
+            kwargs["journal_path"] = None
+            aign = cls(chatLLM, **kwargs)
+            aign.journal_path = path
+            aign.journal = NovelJournal(
+                path, record_path=aign.record_path, resume=True
+            )
+            aign.loadState(aign.journal.state)
+        return aign
+
+    def exportNovelRecord(self, path=None):
+        """立即重建 novel_record.md"""
+        self.recordNovel()
+        if self.journal is not None:
+            self.journal.exportRecord(path)
 
     def updateMemory(self):
-        if (len(self.no_memory_paragraph)) > 2000:
+        """等待后台总结完成，把未总结的正文总结进记忆"""
+        self.memory_worker.flush()
+
+    def makeMemory(self, writing_memory, no_memory_paragraph):
+        if self.story is not None:
+            return self.makeStoryMemory(no_memory_paragraph)
+        if self.ledger is not None:
+            return self.editMemory(no_memory_paragraph)
+        resp = self.memory_maker.invoke(
+            inputs={
+                "前文记忆": writing_memory,
+                "正文内容": no_memory_paragraph,
+            },
+            output_keys=["新的记忆"],
+        )
+        return resp["新的记忆"]
+
+    def makeStoryMemory(self, no_memory_paragraph):
+        """只让模型输出正文中新出现或变化的设定，合并后的完整设定作为 writing_memory"""
+        resp = self.story_memory_maker.invoke(
+            inputs={
+                "已知设定": self.story.query(no_memory_paragraph),
+                "正文内容": no_memory_paragraph,
+            },
+            output_keys=["人物", "关系", "事件"],
+        )
+        self.story.applyDiff(resp)
+        return self.story.renderAll()
+
+    def editMemory(self, no_memory_paragraph):
+        """模型只输出对编号条目的增删改，输出长度与记忆大小无关"""
+        resp = self.memory_editor.invoke(
+            inputs={
+                "前文记忆": self.ledger.render(),
+                "正文内容": no_memory_paragraph,
+            },
+            output_keys=["操作"],
+        )
+        self.ledger.applyOps(resp["操作"])
+        self.memory_updates += 1
+        if self.compact_every and self.memory_updates % self.compact_every == 0:
             resp = self.memory_maker.invoke(
-                inputs={
-                    "前文记忆": self.writing_memory,
-                    "正文内容": self.no_memory_paragraph,
-                },
+                inputs={"前文记忆": self.ledger.render()},
                 output_keys=["新的记忆"],
             )
-            self.writing_memory = resp["新的记忆"]
-            self.no_memory_paragraph = ""
+            self.ledger.loadText(resp["新的记忆"])
+        return self.ledger.render()
 
-    def genNextParagraph(self, user_requriments=None, embellishment_idea=None):
-        if user_requriments:
-            self.user_requriments = user_requriments
-        if embellishment_idea:
-            self.embellishment_idea = embellishment_idea
+    def getMemoryContext(self, query):
+        if self.story is not None:
+            return self.story.query(query)
+        return self.writing_memory
 
-        resp = self.novel_writer.invoke(
-            inputs={
-                "用户想法": self.user_idea,
-                "大纲": self.novel_outline,
-                "前文记忆": self.writing_memory,
-                "临时设定": self.temp_setting,
-                "计划": self.writing_plan,
-                "用户要求": self.user_requriments,
-                "上文内容": self.getLastParagraph(),
-            },
+    def getExecutor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=2)
+        return self.executor
+
+    def getWriterInputs(self, writing_plan, temp_setting, provisional=None):
+        """上文取最后几段，provisional 为尚未定稿、当作最后一段的草稿"""
+        paragraphs = self.selectLastParagraphs(provisional=provisional)
+        last_paragraph = "".join(p + "\n" for p in reversed(paragraphs))
+        context_start = len(self.paragraph_list) - len(paragraphs) + bool(provisional)
+        return {
+            "用户想法": self.user_idea,
+            "大纲": self.novel_outline,
+            "前文记忆": self.getMemoryContext(
+                f"{writing_plan}\n{temp_setting}\n{last_paragraph}"
+            ),
+            "相关前文": self.getRelatedPassages(
+                f"{writing_plan}\n{temp_setting}", context_start
+            ),
+            "临时设定": temp_setting,
+            "计划": writing_plan,
+            "用户要求": self.user_requriments,
+            "上文内容": last_paragraph,
+        }
+
+    def draftParagraph(self, inputs, on_paragraph=None):
+        """stream 为 True 时，# 段落 写完就调用 on_paragraph(段落)，每次重新生成都会再调用一次"""
+        inputs = self.fitInputs(self.novel_writer, inputs)
+        if self.candidates > 1:
+            return self.draftCandidates(inputs)
+        validate = self.makeRepetitionCheck()
+        if not self.stream:
+            return self.novel_writer.invoke(
+                inputs=inputs,
+                output_keys=["段落", "计划", "临时设定"],
+                validate=validate,
+            )
+
+        def on_section(key, value):
+            if key != "段落":
+                return
+            if validate is not None:
+                validate({"段落": value})
+            if on_paragraph is not None:
+                on_paragraph(value)
+
+        return self.novel_writer.invoke(
+            inputs=inputs,
             output_keys=["段落", "计划", "临时设定"],
+            on_section=on_section,
         )
-        next_paragraph = resp["段落"]
-        next_writing_plan = resp["计划"]
-        next_temp_setting = resp["临时设定"]
 
+    def makeRepetitionCheck(self):
+        """返回检查草稿是否与前文重复的 validate，每次起草各自计算退回次数"""
+        if self.repetition is None:
+            return None
+        rejects = 0
+
+        def validate(sections):
+            nonlocal rejects
+            report = self.repetition.check(sections["段落"])
+            self.repetition_report = report
+            if not report["repetitive"]:
+                return
+            message = (
+                f"段落与前文重复：与最近段落重复的片段占 {report['overlap']:.0%}，"
+                f"段内重复的片段占 {report['self_repeat']:.0%}"
+            )
+            if rejects < self.max_rejects:
+                rejects += 1
+                raise ParseError(message)
+            print("-" * 30 + f"\n{message}\n已达到重写次数上限，保留该段\n" + "-" * 30)
+
+        return validate
+
+    def draftCandidates(self, inputs):
+        """并行生成多个草稿，返回本地打分最高的一个，失败的候选被忽略"""
+        if self.candidate_executor is None:
+            self.candidate_executor = ThreadPoolExecutor(max_workers=self.candidates)
+        futures = [
+            self.candidate_executor.submit(
+                self.novel_writer.invoke,
+                inputs,
+                ["段落", "计划", "临时设定"],
+                None,
+                False,
+                self.makeRepetitionCheck(),
+            )
+            for _ in range(self.candidates)
+        ]
+        drafts = []
+        error = None
+        for future in futures:
+            try:
+                drafts.append(future.result())
+            except Exception as e:
+                print("-" * 30 + f"\n候选草稿生成失败：\n{e}\n" + "-" * 30)
+                error = e
+        if not drafts:
+            raise error
+
+        recent = self.paragraph_list[-3:] + [inputs.get("上文内容", "")]
+        self.candidate_scores = [self.scorer.score(d, recent) for d in drafts]
+        best = max(range(len(drafts)), key=self.candidate_scores.__getitem__)
+        return drafts[best]
+
+    def embellishParagraph(self, draft, last_paragraph):
         resp = self.novel_embellisher.invoke(
-            inputs={
-                "大纲": self.novel_outline,
-                "临时设定": next_temp_setting,
-                "计划": next_writing_plan,
-                "润色要求": embellishment_idea,
-                "上文": self.getLastParagraph(),
-                "要润色的内容": next_paragraph,
-            },
+            inputs=self.fitInputs(
+                self.novel_embellisher,
+                {
+                    "大纲": self.novel_outline,
+                    "临时设定": draft["临时设定"],
+                    "计划": draft["计划"],
+                    "润色要求": self.embellishment_idea,
+                    "上文": last_paragraph,
+                    "要润色的内容": draft["段落"],
+                },
+            ),
             output_keys=["润色结果"],
         )
-        next_paragraph = resp["润色结果"]
+        return resp["润色结果"]
 
-        self.paragraph_list.append(next_paragraph)
-        self.writing_plan = next_writing_plan
-        self.temp_setting = next_temp_setting
+    def commitParagraph(self, next_paragraph, draft):
+        self.appendParagraph(next_paragraph)
+        self.writing_plan = draft["计划"]
+        self.temp_setting = draft["临时设定"]
 
-        self.no_memory_paragraph += f"\n{next_paragraph}"
+        # 在后台总结记忆，落后太多时才等待
+        self.memory_worker.add(next_paragraph)
+
+    def genNextParagraph(self, user_requriments=None, embellishment_idea=None):
+        if user_requriments:
+            self.user_requriments = user_requriments
+        if embellishment_idea:
+            self.embellishment_idea = embellishment_idea
+
+        self.memory_worker.poll()
+        if self.pipelined:
+            return self.genNextParagraphPipelined()
+
+        inputs = self.getWriterInputs(self.writing_plan, self.temp_setting)
+        last_paragraph = inputs["上文内容"]
+        early = {}
+
+        def on_paragraph(paragraph):
+            # 模型继续写计划与临时设定的同时润色
+            early["paragraph"] = paragraph
+            early["future"] = self.getExecutor().submit(
+                self.embellishParagraph,
+                {
+                    "段落": paragraph,
+                    "计划": self.writing_plan,
+                    "临时设定": self.temp_setting,
+                },
+                last_paragraph,
+            )
+
+        draft = self.draftParagraph(inputs, on_paragraph)
+        if early.get("paragraph") == draft["段落"]:
+            next_paragraph = early["future"].result()
+        else:
+            # 没有流式输出，或最终采用的段落来自补全或缓存
+            next_paragraph = self.embellishParagraph(draft, last_paragraph)
+
+        self.commitParagraph(next_paragraph, draft)
 
-        self.updateMemory()
-        self.updateNovelContent()
         self.recordNovel()
 
         return next_paragraph
+
+    def genNextParagraphPipelined(self):
+        """润色第 N 段的同时起草第 N+1 段，返回润色好的第 N 段"""
+        inputs = self.getWriterInputs(self.writing_plan, self.temp_setting)
+        last_paragraph = inputs["上文内容"]
+        if self.pending_draft is None:
+            self.pending_draft = self.draftParagraph(inputs)
+        draft = self.pending_draft
+
+        # 以未润色的草稿作为临时上文起草下一段
+        next_draft_future = self.getExecutor().submit(
+            self.draftParagraph,
+            self.getWriterInputs(
+                draft["计划"], draft["临时设定"], provisional=draft["段落"]
+            ),
+        )
+        next_paragraph = self.embellishParagraph(draft, last_paragraph)
+
+        self.commitParagraph(next_paragraph, draft)
+        self.pending_draft = None
+
+        self.recordNovel()
+
+        self.pending_draft = next_draft_future.result()
+
+        return next_paragraph
+
+    def flushPipeline(self):
+        """润色并写入已起草的段落，等待后台记忆总结完成"""
+        if self.pending_draft is not None:
+            draft = self.pending_draft
+            next_paragraph = self.embellishParagraph(draft, self.getLastParagraph())
+            self.commitParagraph(next_paragraph, draft)
+            self.pending_draft = None
+        self.updateMemory()
+        self.exportNovelRecord()
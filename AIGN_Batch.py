@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+from AIGN import AIGN
+from AIGN_Journal import writeFileAtomic
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class LLMScheduler:
+    """
+    多本书共用的 chatLLM 调度器
+    - 同时进行的请求不超过 max_concurrency 个
+    - tokens_per_minute 不为空时，最近一分钟内的 token 用量（未完成的请求按估计值计）不超过该值
+    - 空出名额时优先放行已完成请求最少的书，每本书内部按先后顺序
+    for_book(book) 返回与 chatLLM 用法相同、按 book 排队的函数
+    """
+
+    def __init__(
+        self,
+        chatLLM,
+        max_concurrency=4,
+        tokens_per_minute=None,
+        completion_estimate=1500,
+        window=60.0,
+    ):
+        self.chatLLM = chatLLM
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.completion_estimate = completion_estimate
+        self.window = window
+
+        self.cond = threading.Condition()
+        self.running = 0
+        self.waiting = {}
+        self.served = {}
+        self.usage = deque()
+        self.tickets = count()
+
+    def estimateTokens(self, messages, max_tokens=None) -> int:
+        """按一个字一个 token 粗略估计"""
+        prompt_tokens = sum(len(m["content"]) for m in messages)
+        return prompt_tokens + (max_tokens or self.completion_estimate)
+
+    def nextTicket(self):
+        book = min(
+            (b for b, q in self.waiting.items() if q),
+            key=lambda b: (self.served.get(b, 0), self.waiting[b][0]),
+        )
+        return self.waiting[book][0]
+
+    def budgetWait(self, estimate) -> float:
+        """返回需要等待的秒数，0 表示预算足够"""
+        if self.tokens_per_minute is None:
+            return 0.0
+        now = time.monotonic()
+        while self.usage and self.usage[0][0] + self.window <= now:
+            self.usage.popleft()
+        used = sum(entry[1] for entry in self.usage)
+        # 单个请求超过预算时，等到窗口清空后放行
+        if not self.usage or used + estimate <= self.tokens_per_minute:
+            return 0.0
+        return self.usage[0][0] + self.window - now
+
+    def acquire(self, book, estimate) -> list:
+        with self.cond:
+            ticket = next(self.tickets)
+            self.waiting.setdefault(book, deque()).append(ticket)
+            while True:
+                if self.running < self.max_concurrency and self.nextTicket() == ticket:
+                    wait = self.budgetWait(estimate)
+                    if wait <= 0:
+                        break
+                    self.cond.wait(wait)
+                else:
+                    self.cond.wait()
+            self.waiting[book].popleft()
+            self.running += 1
+            self.served[book] = self.served.get(book, 0) + 1
+            entry = [time.monotonic(), estimate]
+            self.usage.append(entry)
+            self.cond.notify_all()
+            return entry
+
+    def release(self, entry, total_tokens=None):
+        with self.cond:
+            self.running -= 1
+            if total_tokens is not None:
+                entry[1] = total_tokens
+            self.cond.notify_all()
+
+    def for_book(self, book, inner=None):
+        inner = inner or self.chatLLM
+
+        def chatLLM(
+            messages: list,
+            temperature=None,
+            top_p=None,
+            max_tokens=None,
+            stream=False,
+            delta=False,
+        ):
+            kwargs = {
+                "messages": messages,
+                "temperature": temperature,
+                "top_p": top_p,
+                "max_tokens": max_tokens,
+            }
+            if delta:
+                kwargs["delta"] = True
+            estimate = self.estimateTokens(messages, max_tokens)
+
+            if not stream:
+                entry = self.acquire(book, estimate)
+                resp = None
+                try:
+                    resp = inner(**kwargs)
+                    return resp
+                finally:
+                    self.release(entry, resp and resp.get("total_tokens"))
+            else:
+
+                def respGenerator():
+                    # 整个流式输出期间占用一个名额
+                    entry = self.acquire(book, estimate)
+                    total_tokens = None
+                    try:
+                        for resp in inner(**kwargs, stream=True):
+                            total_tokens = resp.get("total_tokens") or total_tokens
+                            yield resp
+                    finally:
+                        self.release(entry, total_tokens)
+
+                return respGenerator()
+
+        chatLLM.model_name = getattr(inner, "model_name", None)
+        chatLLM.provider = getattr(inner, "provider", None)
+        chatLLM.supports_delta = getattr(inner, "supports_delta", False)
+        if hasattr(inner, "for_agent"):
+            chatLLM.for_agent = lambda name: self.for_book(book, inner.for_agent(name))
+
+        return chatLLM
+
+
+class BatchRunner:
+    """
+    同时创作多本小说，每本写到 target_length 字为止
+    - 所有书的 agent 调用经同一个 LLMScheduler 排队，共用并发与每分钟 token 预算
+    - 第 i 本书写在 output_dir/book_{i:03d}/ 下，各自有日志与 novel_record.md，
+      中断后重新运行会从日志继续，已完成的书直接跳过
+    - 每写完一段更新 output_dir/progress.json
+    """
+
+    def __init__(
+        self,
+        chatLLM,
+        ideas,
+        output_dir="novels",
+        target_length=100000,
+        max_concurrency=4,
+        tokens_per_minute=None,
+        max_parallel_books=None,
+        user_requriments="",
+        embellishment_idea="",
+        **aign_kwargs,
+    ):
+        """
+        max_parallel_books 为同时在写的书的数量上限，默认所有书同时写，每本书都会写完
+        aign_kwargs 原样传给每本书的 AIGN，例如 pipelined、cache、metrics
+        """
+        self.scheduler = LLMScheduler(
+            chatLLM,
+            max_concurrency=max_concurrency,
+            tokens_per_minute=tokens_per_minute,
+        )
+        self.ideas = list(ideas)
+        self.output_dir = output_dir
+        self.target_length = target_length
+        self.max_parallel_books = max_parallel_books or len(self.ideas)
+        self.user_requriments = user_requriments
+        self.embellishment_idea = embellishment_idea
+        self.aign_kwargs = aign_kwargs
+
+        self.lock = threading.Lock()
+        self.books = [
+            {
+                "book": i,
+                "idea": idea,
+                "dir": os.path.join(output_dir, f"book_{i:03d}"),
+                "status": PENDING,
+                "paragraphs": 0,
+                "length": 0,
+                "error": None,
+            }
+            for i, idea in enumerate(self.ideas)
+        ]
+
+    def openBook(self, book) -> AIGN:
+        os.makedirs(book["dir"], exist_ok=True)
+        journal_path = os.path.join(book["dir"], "novel_record.journal")
+        record_path = os.path.join(book["dir"], "novel_record.md")
+        chatLLM = self.scheduler.for_book(book["book"])
+        if os.path.exists(journal_path):
+            return AIGN.resume(
+                journal_path, chatLLM, record_path=record_path, **self.aign_kwargs
+            )
+        return AIGN(
+            chatLLM,
+            journal_path=journal_path,
+            record_path=record_path,
+            **self.aign_kwargs,
+        )
+
+    def writeBook(self, book):
+        self.updateProgress(book, status=RUNNING)
+        try:
+            aign = self.openBook(book)
+            if not aign.novel_outline:
+                aign.genNovelOutline(book["idea"])
+            if not aign.paragraph_list:
+                aign.genBeginning(self.user_requriments, self.embellishment_idea)
+            self.updateProgress(book, aign=aign)
+            while len(aign.novel_text) < self.target_length:
+                aign.genNextParagraph()
+                self.updateProgress(book, aign=aign)
+            if aign.pipelined:
+                aign.flushPipeline()
+            else:
+                aign.exportNovelRecord()
+            self.updateProgress(book, aign=aign, status=DONE)
+        except Exception as e:
+            print("-" * 30 + f"\n第 {book['book']} 本书失败：\n{e}\n" + "-" * 30)
+            self.updateProgress(book, status=FAILED, error=str(e))
+
+    def updateProgress(self, book, aign=None, **kwargs):
+        with self.lock:
+            book.update(kwargs)
+            if aign is not None:
+                book["paragraphs"] = len(aign.paragraph_list)
+                book["length"] = len(aign.novel_text)
+            writeFileAtomic(
+                os.path.join(self.output_dir, "progress.json"),
+                json.dumps(self.progress(), ensure_ascii=False, indent=2),
+            )
+
+    def progress(self) -> list:
+        return [
+            {
+                "book": b["book"],
+                "idea": b["idea"][:30],
+                "status": b["status"],
+                "paragraphs": b["paragraphs"],
+                "length": b["length"],
+                "target_length": self.target_length,
+                "error": b["error"],
+            }
+            for b in self.books
+        ]
+
+    def run(self) -> list:
+        """写完所有书后返回每本书的进度"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_parallel_books) as executor:
+            list(executor.map(self.writeBook, self.books))
+        return self.progress()
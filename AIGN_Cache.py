@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    以请求内容为键的模型回复缓存，保存在本地 sqlite 文件中
+    - 键为 hash(sys_prompt, messages, temperature, top_p, model)
+    - 超过 max_bytes 或 max_entries 时按最近最少使用淘汰
+    - hits / misses 记录命中与未命中次数
+    只有成功解析的回复才会被写入，用于确定性重放、测试与演示
+    """
+
+    def __init__(self, path="llm_cache.sqlite3", max_bytes=64 * 1024 * 1024, max_entries=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, content TEXT, size INTEGER, last_used REAL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def makeKey(sys_prompt, messages, temperature, top_p, model) -> str:
+        payload = json.dumps(
+            [sys_prompt, messages, temperature, top_p, model],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT content FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.conn.execute(
+                "UPDATE cache SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key, content: str):
+        size = len(content.encode("utf-8"))
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, content, size, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, content, size, time.time()),
+            )
+            self.evict()
+            self.conn.commit()
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.conn.commit()
+
+    def evict(self):
+        count, total_size = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+        while count > 0 and (
+            (self.max_bytes is not None and total_size > self.max_bytes)
+            or (self.max_entries is not None and count > self.max_entries)
+        ):
+            key, size = self.conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_used LIMIT 1"
+            ).fetchone()
+            self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            count -= 1
+            total_size -= size
+
+    def stats(self) -> dict:
+        with self.lock:
+            count, total_size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": count,
+            "bytes": total_size,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+            self.conn.commit()
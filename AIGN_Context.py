@@ -0,0 +1,130 @@
+import math
+import re
+import threading
+from collections import OrderedDict
+
+# 每个字符约合多少 token：(中日韩字符, 其他字符)，按各家公开的换算比例估计
+TOKENS_PER_CHAR = {
+    "zhipu": (0.6, 0.3),
+    "deepseek": (0.6, 0.3),
+    "ali": (0.7, 0.3),
+    "fake": (1.0, 1.0),
+    None: (1.0, 0.35),
+}
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+# 各输入部分的预算
+# - priority 越低越先被截断
+# - min_tokens 为截断后至少保留的 token 数，没有 min_tokens 的部分不会被截断
+# - max_tokens 为单个部分的上限
+# - keep 为截断时保留开头（head）还是结尾（tail）
+SECTION_BUDGETS = {
+    "用户要求": {"priority": 6},
+    "润色要求": {"priority": 6},
+    "要润色的内容": {"priority": 6},
+    "计划": {"priority": 5, "min_tokens": 300, "max_tokens": 1000},
+    "临时设定": {"priority": 4, "min_tokens": 200, "max_tokens": 1000},
+    "上文内容": {"priority": 3, "min_tokens": 300, "max_tokens": 1500, "keep": "tail"},
+    "上文": {"priority": 3, "min_tokens": 300, "max_tokens": 1500, "keep": "tail"},
+    "前文记忆": {"priority": 2, "min_tokens": 200, "max_tokens": 2000, "keep": "tail"},
+    "相关前文": {"priority": 1, "min_tokens": 0, "max_tokens": 1000},
+    "大纲": {"priority": 1, "min_tokens": 300, "max_tokens": 2000},
+    "用户想法": {"priority": 0, "min_tokens": 0, "max_tokens": 500},
+}
+
+
+class TokenCounter:
+    """
+    按服务商的换算比例估计 token 数
+    同一段文本（大纲、记忆、已定稿的段落）在每次请求中反复出现，计数结果按文本缓存
+    """
+
+    def __init__(self, provider=None, max_entries=4096):
+        self.cjk_rate, self.other_rate = TOKENS_PER_CHAR.get(
+            provider, TOKENS_PER_CHAR[None]
+        )
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.counts = OrderedDict()
+
+    def count(self, text: str) -> int:
+        with self.lock:
+            if text in self.counts:
+                self.counts.move_to_end(text)
+                return self.counts[text]
+        cjk = len(CJK_PATTERN.findall(text))
+        tokens = math.ceil(cjk * self.cjk_rate + (len(text) - cjk) * self.other_rate)
+        with self.lock:
+            self.counts[text] = tokens
+            if len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+        return tokens
+
+    def truncate(self, text: str, max_tokens: int, keep="head") -> str:
+        """截断到不超过 max_tokens，尽量在换行处断开"""
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        length = int(len(text) * max_tokens / tokens)
+        while True:
+            piece = text[:length] if keep == "head" else text[len(text) - length :]
+            if self.count(piece) <= max_tokens or length == 0:
+                break
+            length = int(length * 0.95)
+
+        # 在靠近断口的换行处断开，避免留下半句
+        if keep == "head":
+            cut = piece.rfind("\n")
+            if cut > len(piece) * 0.8:
+                piece = piece[:cut]
+        else:
+            cut = piece.find("\n")
+            if 0 <= cut < len(piece) * 0.2:
+                piece = piece[cut + 1 :]
+        return piece
+
+
+class ContextBuilder:
+    """
+    把 agent 的输入控制在 token 预算之内
+    - 先按 SECTION_BUDGETS 把每个部分截到各自的 max_tokens
+    - 总量仍超出 budget 时，从 priority 最低的部分开始截断，直到不超出或都已截到 min_tokens
+    """
+
+    def __init__(self, counter: TokenCounter, budget: int, sections=None):
+        self.counter = counter
+        self.budget = budget
+        self.sections = sections or SECTION_BUDGETS
+
+    def fit(self, inputs: dict, reserved=0) -> dict:
+        """reserved 为系统提示词等固定部分占用的 token 数"""
+        inputs = dict(inputs)
+        tokens = {}
+        for k, v in inputs.items():
+            if not isinstance(v, str):
+                continue
+            spec = self.sections.get(k, {})
+            if spec.get("max_tokens") is not None:
+                v = inputs[k] = self.counter.truncate(
+                    v, spec["max_tokens"], spec.get("keep", "head")
+                )
+            tokens[k] = self.counter.count(v)
+
+        excess = reserved + sum(tokens.values()) - self.budget
+        for k in sorted(tokens, key=lambda k: self.sections.get(k, {}).get("priority", 0)):
+            if excess <= 0:
+                break
+            spec = self.sections.get(k, {})
+            if spec.get("min_tokens") is None:
+                continue
+            target = max(spec["min_tokens"], tokens[k] - excess)
+            if target >= tokens[k]:
+                continue
+            inputs[k] = self.counter.truncate(inputs[k], target, spec.get("keep", "head"))
+            new_tokens = self.counter.count(inputs[k])
+            excess -= tokens[k] - new_tokens
+            tokens[k] = new_tokens
+        return inputs
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+RECORD_FIELDS = [
+    "user_idea",
+    "user_requriments",
+    "embellishment_idea",
+    "novel_outline",
+    "writing_memory",
+    "writing_plan",
+    "temp_setting",
+    "no_memory_paragraph",
+]
+
+
+def writeFileAtomic(path, content: str):
+    """先写临时文件再替换，写到一半崩溃也不会留下残缺的文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class NovelJournal:
+    """
+    小说的追加式日志，每一步的写入量与全书长度无关
+    - 新段落与有变化的状态以一行 JSON 追加写入并 fsync
+    - 日志的字节数达到上一次快照的大小（至少 min_snapshot_bytes）时压缩成一次快照，日志随之清空；
+      给出 record_path 时同时重建 novel_record.md。重写全书的开销由之前追加的同样多的字节分摊，
+      每一步的平均写入量仍与全书长度无关
+    - 重新打开时由快照与日志恢复状态，写到一半的最后一行会被忽略
+    resume 为 False 时开始一部新小说：path 上已有日志时报错，overwrite 为 True 时才清空
+    """
+
+    def __init__(
+        self,
+        path,
+        record_path=None,
+        min_snapshot_bytes=65536,
+        resume=False,
+        overwrite=False,
+    ):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.record_path = record_path
+        self.min_snapshot_bytes = min_snapshot_bytes
+
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.log_bytes = 0
+        self.snapshot_bytes = 0
+        self.state = {"paragraphs": [], **{k: "" for k in RECORD_FIELDS}}
+
+        if resume:
+            self.restore()
+        else:
+            existing = [p for p in (self.path, self.snapshot_path) if os.path.exists(p)]
+            if existing and not overwrite:
+                raise FileExistsError(
+                    f"{path} 已有日志，继续写作请用 resume，开始新小说请指定 overwrite"
+                )
+            for p in existing:
+                os.remove(p)
+
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def restore(self):
+        if os.path.exists(self.snapshot_path):
+            self.snapshot_bytes = os.path.getsize(self.snapshot_path)
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.seq = snapshot["seq"]
+            self.state.update(snapshot["state"])
+
+        if os.path.exists(self.path):
+            valid_length = 0
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete record")
+                        record = json.loads(line.decode("utf-8"))
+                    except ValueError:
+                        # 崩溃时写了一半的记录，截掉以免之后的追加接在它后面
+                        break
+                    valid_length += len(line)
+                    if record["seq"] <= self.seq:
+                        continue
+                    self.apply(record)
+                    self.seq = record["seq"]
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_length)
+            self.log_bytes = valid_length
+
+    def apply(self, record):
+        op = record["op"]
+        if op == "paragraph":
+            self.state["paragraphs"].append(record["value"])
+        elif op == "paragraphs":
+            self.state["paragraphs"] = list(record["value"])
+        elif op == "set":
+            self.state[record["key"]] = record["value"]
+
+    def sync(self, paragraphs: list, fields: dict):
+        """把与日志中状态不同的部分追加写入"""
+        with self.lock:
+            records = []
+            recorded = self.state["paragraphs"]
+            if len(paragraphs) >= len(recorded):
+                for paragraph in paragraphs[len(recorded) :]:
+                    records.append({"op": "paragraph", "value": paragraph})
+            else:
+                records.append({"op": "paragraphs", "value": list(paragraphs)})
+            for k, v in fields.items():
+                if self.state.get(k) != v:
+                    records.append({"op": "set", "key": k, "value": v})
+            if not records:
+                return
+
+            for record in records:
+                self.seq += 1
+                record["seq"] = self.seq
+                self.apply(record)
+                line = json.dumps(record, ensure_ascii=False) + "\n"
+                self.file.write(line)
+                self.log_bytes += len(line.encode("utf-8"))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            if self.log_bytes >= max(self.snapshot_bytes, self.min_snapshot_bytes):
+                self.snapshot()
+
+    def snapshot(self):
+        """把当前状态写成快照并清空日志"""
+        content = json.dumps({"seq": self.seq, "state": self.state}, ensure_ascii=False)
+        writeFileAtomic(self.snapshot_path, content)
+        self.snapshot_bytes = len(content.encode("utf-8"))
+        self.file.close()
+        self.file = open(self.path, "w", encoding="utf-8")
+        self.log_bytes = 0
+        if self.record_path:
+            writeFileAtomic(self.record_path, self.render())
+
+    def render(self) -> str:
+        """按 novel_record.md 的格式输出当前状态"""
+        record_content = ""
+        record_content += f"# 大纲\n\n{self.state['novel_outline']}\n\n"
+        record_content += f"# 正文\n\n"
+        record_content += "".join(f"{p}\n\n" for p in self.state["paragraphs"])
+        record_content += f"# 记忆\n\n{self.state['writing_memory']}\n\n"
+        record_content += f"# 计划\n\n{self.state['writing_plan']}\n\n"
+        record_content += f"# 临时设定\n\n{self.state['temp_setting']}\n\n"
+        return record_content
+
+    def exportRecord(self, path=None):
+        with self.lock:
+            writeFileAtomic(path or self.record_path, self.render())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
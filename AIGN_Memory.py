@@ -0,0 +1,311 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+EMPTY_VALUES = ("", "无", "没有", "暂无")
+
+
+def parseItems(text: str) -> list:
+    """取出以“- ”开头的条目"""
+    items = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith(("-", "*")):
+            line = line[1:].strip()
+        if line not in EMPTY_VALUES:
+            items.append(line)
+    return items
+
+
+def splitPair(text: str, separators="：:"):
+    for sep in separators:
+        if sep in text:
+            left, right = text.split(sep, 1)
+            return left.strip(), right.strip()
+    return text.strip(), ""
+
+
+class StoryMemory:
+    """
+    结构化的故事记忆：人物及其属性、人物关系、关键事件
+    - applyDiff 合并模型输出的增量（只包含新出现或变化的条目）
+    - query 只取出文本中提到的人物的相关条目，代替每次都发送完整的记忆
+    - renderAll 的文本可由 loadText 还原，因此可以直接存在 writing_memory 中
+    - 只保留最近 max_stored_events 个事件，writing_memory 与每次写入日志的记忆不随书长增长；
+      开启检索时，移出记忆的事件会被索引，仍可作为相关前文取回
+    """
+
+    def __init__(self, recent_events=5, max_events=10, max_stored_events=200):
+        self.recent_events = recent_events
+        self.max_events = max_events
+        self.max_stored_events = max_stored_events
+
+        self.lock = threading.Lock()
+        self.characters = {}
+        self.relations = {}
+        self.events = []
+
+    def applyDiff(self, diff: dict):
+        """diff 为 # 人物 / # 关系 / # 事件 三部分的文本"""
+        with self.lock:
+            for item in parseItems(diff.get("人物", "")):
+                name, attrs = splitPair(item)
+                if not name:
+                    continue
+                character = self.characters.setdefault(name, {})
+                for attr in re.split(r"[；;]", attrs):
+                    key, value = splitPair(attr, "=＝")
+                    if key and value:
+                        character[key] = value
+
+            for item in parseItems(diff.get("关系", "")):
+                pair, relation = splitPair(item)
+                names = [n.strip() for n in re.split(r"->|→", pair)]
+                if len(names) != 2 or not all(names) or not relation:
+                    continue
+                self.relations.setdefault(names[0], {})[names[1]] = relation
+                for name in names:
+                    self.characters.setdefault(name, {})
+
+            for item in parseItems(diff.get("事件", "")):
+                match = re.match(r"(.*?)[（(]([^（(]*)[）)]\s*$", item)
+                if match:
+                    text = match.group(1).strip()
+                    names = [n.strip() for n in re.split(r"[，,、]", match.group(2))]
+                else:
+                    text, names = item, []
+                self.events.append({"text": text, "characters": [n for n in names if n]})
+            if self.max_stored_events and len(self.events) > self.max_stored_events:
+                del self.events[: -self.max_stored_events]
+
+    def mentioned(self, text: str) -> list:
+        with self.lock:
+            return [name for name in self.characters if name in text]
+
+    def query(self, text: str) -> str:
+        """文本中提到的人物、他们之间的关系，以及最近的事件与他们参与的事件"""
+        names = set(self.mentioned(text))
+        with self.lock:
+            events = self.events[-self.recent_events :]
+            related = [
+                e
+                for e in self.events[: -self.recent_events or None]
+                if names.intersection(e["characters"])
+            ]
+            room = max(self.max_events - len(events), 0)
+            events = related[len(related) - room :] + events
+            relations = {}
+            for a, targets in self.relations.items():
+                for b, r in targets.items():
+                    if a in names or b in names:
+                        relations.setdefault(a, {})[b] = r
+            return self.render(
+                {n: self.characters[n] for n in self.characters if n in names},
+                relations,
+                events,
+            )
+
+    def loadText(self, text: str):
+        """从 renderAll 输出的文本恢复，用于从 writing_memory 重建"""
+        self.loadState({})
+        diff = {}
+        key = None
+        for line in text.split("\n"):
+            if line.startswith("## "):
+                key = line[3:].strip()
+                diff[key] = ""
+            elif key is not None:
+                diff[key] += line + "\n"
+        self.applyDiff(diff)
+
+    @staticmethod
+    def render(characters: dict, relations: dict, events: list) -> str:
+        content = ""
+        if characters:
+            content += "## 人物\n"
+            for name, attrs in characters.items():
+                attrs = "；".join(f"{k}={v}" for k, v in attrs.items())
+                content += f"- {name}：{attrs}\n" if attrs else f"- {name}\n"
+        lines = [
+            f"- {a} -> {b}：{r}\n"
+            for a, targets in relations.items()
+            for b, r in targets.items()
+        ]
+        if lines:
+            content += "## 关系\n" + "".join(lines)
+        if events:
+            content += "## 事件\n"
+            for e in events:
+                names = "，".join(e["characters"])
+                content += f"- {e['text']}（{names}）\n" if names else f"- {e['text']}\n"
+        return content
+
+    def renderAll(self) -> str:
+        with self.lock:
+            return self.render(self.characters, self.relations, self.events)
+
+    def getState(self) -> dict:
+        with self.lock:
+            return {
+                "characters": self.characters,
+                "relations": self.relations,
+                "events": self.events,
+            }
+
+    def loadState(self, state: dict):
+        with self.lock:
+            self.characters = state.get("characters", {})
+            self.relations = state.get("relations", {})
+            self.events = state.get("events", [])
+
+
+class MemoryLedger:
+    """
+    带编号的记忆条目
+    - applyOps 执行模型输出的 新增 / 修改 编号 / 删除 编号 操作，模型不必重写整份记忆
+    - render 的文本可由 loadText 还原，编号保持不变，因此可以直接存在 writing_memory 中
+    """
+
+    OP_PATTERN = re.compile(r"^(新增|修改|删除)\s*\[?(\d*)\]?\s*[：:]?\s*(.*)$")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def applyOps(self, ops: str) -> int:
+        """返回执行了的操作数，无法识别的行与不存在的编号会被忽略"""
+        applied = 0
+        with self.lock:
+            for item in parseItems(ops):
+                match = self.OP_PATTERN.match(item)
+                if match is None:
+                    continue
+                op, entry_id, text = match.groups()
+                entry_id = int(entry_id) if entry_id else None
+                if op == "新增" and text:
+                    self.entries[self.next_id] = text
+                    self.next_id += 1
+                elif op == "修改" and entry_id in self.entries and text:
+                    self.entries[entry_id] = text
+                elif op == "删除" and entry_id in self.entries:
+                    del self.entries[entry_id]
+                else:
+                    continue
+                applied += 1
+        return applied
+
+    def render(self) -> str:
+        with self.lock:
+            return "".join(f"[{i}] {text}\n" for i, text in self.entries.items())
+
+    def loadText(self, text: str):
+        """从 render 输出的文本恢复；没有编号的行（例如整体重写的记忆）按顺序重新编号"""
+        with self.lock:
+            self.entries = {}
+            self.next_id = 1
+            for line in text.split("\n"):
+                line = line.strip()
+                if not line:
+                    continue
+                match = re.match(r"^\[(\d+)\]\s*(.*)$", line)
+                if match:
+                    entry_id, line = int(match.group(1)), match.group(2)
+                else:
+                    entry_id = self.next_id
+                self.entries[entry_id] = line
+                self.next_id = max(self.next_id, entry_id + 1)
+
+
+class MemoryWorker:
+    """
+    在后台线程总结记忆，写作使用最近一次完成的记忆，不等待总结
+    - 未总结的正文超过 threshold 字时提交一次 summarize(memory, pending)，同一时间只有一次总结在进行，
+      总结期间新写的正文留到下一次
+    - 未总结的正文（包括正在总结的）超过 max_lag_chars 字或 max_lag_paragraphs 段时，add 会等待总结完成
+    - 总结完成后由调用 add / poll 的线程更新 memory 并调用 on_update(memory)
+    - 总结失败时，需要等待的 add / flush 把异常抛给调用方，不等待的 poll 只打印，下次再重新提交
+    """
+
+    def __init__(
+        self,
+        summarize,
+        threshold=2000,
+        max_lag_chars=None,
+        max_lag_paragraphs=None,
+        on_update=None,
+    ):
+        self.summarize = summarize
+        self.threshold = threshold
+        self.max_lag_chars = max_lag_chars
+        self.max_lag_paragraphs = max_lag_paragraphs
+        self.on_update = on_update
+
+        self.executor = None
+        self.job = None
+        self.memory = ""
+        self.pending = ""
+        self.pending_paragraphs = 0
+
+    def setPending(self, pending: str):
+        """直接设置未总结的正文，例如从存档恢复时"""
+        self.pending = pending
+        self.pending_paragraphs = pending.count("\n")
+
+    def add(self, paragraph: str):
+        self.pending += f"\n{paragraph}"
+        self.pending_paragraphs += 1
+        self.poll()
+        self.submit()
+        while self.isLagging() and self.job is not None:
+            self.poll(wait=True)
+            self.submit()
+
+    def isLagging(self) -> bool:
+        if self.max_lag_chars is not None and len(self.pending) > self.max_lag_chars:
+            return True
+        if (
+            self.max_lag_paragraphs is not None
+            and self.pending_paragraphs > self.max_lag_paragraphs
+        ):
+            return True
+        return False
+
+    def submit(self):
+        if self.job is not None or len(self.pending) <= self.threshold:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        future = self.executor.submit(self.summarize, self.memory, self.pending)
+        self.job = (future, len(self.pending), self.pending_paragraphs)
+
+    def poll(self, wait=False) -> bool:
+        """取回已完成的总结，返回记忆是否有更新；wait 为 True 时总结失败会抛出异常"""
+        if self.job is None:
+            return False
+        future, pending_length, pending_paragraphs = self.job
+        if not (wait or future.done()):
+            return False
+        self.job = None
+        try:
+            memory = future.result()
+        except Exception as e:
+            if wait:
+                raise
+            print("-" * 30 + f"\n记忆总结失败：\n{e}\n" + "-" * 30)
+            return False
+        self.memory = memory
+        self.pending = self.pending[pending_length:]
+        self.pending_paragraphs = max(self.pending_paragraphs - pending_paragraphs, 0)
+        if self.on_update is not None:
+            self.on_update(memory)
+        return True
+
+    def flush(self):
+        """等待正在进行的总结，未总结的正文仍超过 threshold 时再总结一次"""
+        self.poll(wait=True)
+        self.submit()
+        self.poll(wait=True)
@@ -0,0 +1,98 @@
+import json
+import threading
+from collections import defaultdict
+
+COUNTERS = [
+    ("calls", "aign_llm_calls_total", "Number of agent calls"),
+    ("errors", "aign_llm_errors_total", "Number of agent calls that failed after all retries"),
+    ("cache_hits", "aign_llm_cache_hits_total", "Number of agent calls served from ResponseCache"),
+    ("retries", "aign_llm_retries_total", "Number of retried attempts"),
+    ("prompt_tokens", "aign_llm_prompt_tokens_total", "Prompt tokens reported by the provider"),
+    ("completion_tokens", "aign_llm_completion_tokens_total", "Completion tokens reported by the provider"),
+    ("total_tokens", "aign_llm_tokens_total", "Total tokens reported by the provider"),
+    ("cached_tokens", "aign_llm_prompt_cache_hit_tokens_total", "Prompt tokens served from the provider's prefix cache"),
+]
+SUMMARIES = [
+    ("latency", "aign_llm_latency_seconds", "Agent call latency including retries"),
+    ("ttft", "aign_llm_ttft_seconds", "Time to first token of the successful attempt"),
+]
+
+
+def formatValue(value) -> str:
+    """整数按整数输出，其余按完整精度输出；:g 只保留 6 位有效数字，百万以上的计数会失真"""
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRecorder:
+    """
+    记录每次 agent 调用的耗时与 token 用量
+    - 每次调用一条记录：agent、模型、prompt/completion tokens、首 token 延迟、总耗时、重试次数
+    - trace_path 不为空时每条记录追加写入 JSONL 文件
+    - exportPrometheus 按 agent 输出 Prometheus 文本格式的计数
+    """
+
+    def __init__(self, trace_path=None):
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        self.counters = defaultdict(lambda: defaultdict(float))
+        self.summaries = defaultdict(lambda: defaultdict(lambda: [0.0, 0]))
+        self.trace_file = None
+        if trace_path:
+            self.trace_file = open(trace_path, "a", encoding="utf-8")
+
+    def record(self, record: dict):
+        agent = record.get("agent") or ""
+        with self.lock:
+            counters = self.counters[agent]
+            counters["calls"] += 1
+            counters["errors"] += 1 if record.get("error") else 0
+            counters["cache_hits"] += 1 if record.get("cached") else 0
+            counters["retries"] += record.get("retries") or 0
+            for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"):
+                counters[k] += record.get(k) or 0
+            for k, _, _ in SUMMARIES:
+                if record.get(k) is not None:
+                    summary = self.summaries[agent][k]
+                    summary[0] += record[k]
+                    summary[1] += 1
+
+            if self.trace_file is not None:
+                self.trace_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.trace_file.flush()
+
+    def summary(self) -> dict:
+        """按 agent 汇总的计数、平均耗时与平均首 token 延迟"""
+        with self.lock:
+            result = {}
+            for agent, counters in self.counters.items():
+                result[agent] = dict(counters)
+                for k, _, _ in SUMMARIES:
+                    total, count = self.summaries[agent][k]
+                    result[agent][f"avg_{k}"] = total / count if count else None
+            return result
+
+    def exportPrometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for key, name, help_text in COUNTERS:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for agent, counters in self.counters.items():
+                    lines.append(f'{name}{{agent="{agent}"}} {formatValue(counters[key])}')
+            for key, name, help_text in SUMMARIES:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} summary")
+                for agent in self.counters:
+                    total, count = self.summaries[agent][key]
+                    lines.append(f'{name}_sum{{agent="{agent}"}} {formatValue(total)}')
+                    lines.append(f'{name}_count{{agent="{agent}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        with self.lock:
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
@@ -116,6 +116,7 @@ novel_writer_prompt = """
 ## Inputs:
 - 大纲：概述小说的总体框架与关键设定。
 - 前文记忆：为确保故事的前后连贯性，记录下你之前写作的关键信息。
+- 相关前文：从更早的正文与记忆中找出的、与当前计划相关的片段，用于保持前后一致。
 - 临时设定：记录不在大纲中的剧情细节，以备随时参考。
 - 计划：之前对故事发展方向的设想。
 - 用户要求：根据用户的特殊需求，调整故事内容。
@@ -279,3 +280,80 @@ memory_maker_prompt = """
 ## Init:
 在开始之前，请确保你已经完全理解了上述流程和目标。如果你准备好了，可以回复我“明白了”
 """
+
+story_memory_maker_prompt = """
+# Role:
+网络小说作家
+## Beckground And Goals:
+作为长篇网络小说的作者，你用一份结构化的设定库记录人物、人物关系与关键事件，写作时只查阅与当前剧情相关的条目。每写完一部分正文，你只记录其中新出现或发生变化的信息，不重复设定库中已有的内容。
+## Inputs:
+- 已知设定：设定库中与正文内容相关的人物、关系与事件。
+- 正文内容：新写的小说正文。
+## Outputs:
+以固定格式输出，每条一行，以“- ”开头；某一部分没有新信息时写“无”：
+```
+# 人物
+- 人物名：属性=值；属性=值
+# 关系
+- 人物名 -> 人物名：关系
+# 事件
+- 事件的简要描述（相关人物，相关人物）
+# END
+```
+输出的示例：
+```
+# 人物
+- 罗瑜：身份=低等魔族；性格=恶劣；目标=成为魔族大帝
+- 艾琳：身份=勇者
+# 关系
+- 罗瑜 -> 艾琳：宿敌
+# 事件
+- 罗瑜独自闯入勇者营地，被艾琳击退（罗瑜，艾琳）
+# END
+```
+## Workflows:
+1. **对照设定**：阅读已知设定，明确哪些信息已经记录过。
+2. **提取变化**：从正文内容中找出新登场的人物、人物属性的变化、人物关系的变化与推动剧情的关键事件。
+3. **精简输出**：属性只写变化后的值，事件用一句话概括，不要复述已知设定中没有变化的内容。
+## Init:
+在开始之前，请确保你已经完全理解了上述流程和目标。如果你准备好了，可以回复我“明白了”
+"""
+
+memory_editor_prompt = """
+# Role:
+网络小说作家
+## Beckground And Goals:
+作为长篇网络小说的作者，你把前文的重要信息记录成一条条带编号的记忆。每写完一部分正文，你只对记忆做必要的增删改，而不是重写整份记忆。
+## Inputs:
+- 前文记忆：带编号的记忆条目，每行一条，形如“[3] 内容”。
+- 正文内容：新写的小说正文。
+## Outputs:
+以固定格式输出，每行一个操作；没有需要修改的内容时写“无”：
+```
+# 操作
+新增：新的记忆内容
+修改 3：修改后的完整内容
+删除 5
+# END
+```
+## Workflows:
+1. **对照记忆**：阅读前文记忆，明确哪些信息已经记录过。
+2. **提取变化**：从正文内容中找出新的重要信息、剧情要点与设定变化。
+3. **输出操作**：新信息用“新增”，已有条目发生变化用“修改 编号”，过时或不再重要的条目用“删除 编号”。不要输出没有变化的条目。
+## Init:
+在开始之前，请确保你已经完全理解了上述流程和目标。如果你准备好了，可以回复我“明白了”
+"""
+
+book_planner_prompt = """请把以下小说大纲拆分为若干章节。每一章给出章节大纲、本章结束时的剧情状态（简洁，供下一章衔接），以及按顺序排列的段落大纲。
+以固定格式输出，其他的什么都不要加：
+```
+# 第1章
+章节大纲：这一章的主要情节
+结尾：本章结束时人物与剧情的状态
+- 第一段的段落大纲
+- 第二段的段落大纲
+# 第2章
+...
+# END
+```
+"""
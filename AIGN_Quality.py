@@ -0,0 +1,158 @@
+import math
+import threading
+from collections import deque
+
+# 写作提示词要求避免的指向未来的暗示，以及模型跳出小说的自述
+BANNED_PHRASES = [
+    "将来",
+    "未来",
+    "前方",
+    "启程",
+    "作为一个AI",
+    "作为AI",
+    "以下是",
+    "综上所述",
+    "总而言之",
+]
+
+
+def shingles(text: str, n=4) -> set:
+    """去掉空白后相邻 n 个字的集合"""
+    text = "".join(text.split())
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+class CandidateScorer:
+    """
+    在本地给写作 agent 的多个候选草稿打分，不需要再请模型评判
+    - 缺少 required_keys 中任一部分的候选直接淘汰
+    - 段落短于 min_length 字或长于 max_length 字按比例扣分
+    - 与最近几段重复的 n 字片段占比、段落内部重复的 n 字片段占比扣分
+    - 每出现一次 banned_phrases 中的词扣分
+    分数越高越好，满分为 1
+    """
+
+    def __init__(
+        self,
+        min_length=700,
+        max_length=3000,
+        banned_phrases=None,
+        required_keys=("段落", "计划", "临时设定"),
+        ngram=4,
+        weights=None,
+    ):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.banned_phrases = BANNED_PHRASES if banned_phrases is None else banned_phrases
+        self.required_keys = list(required_keys)
+        self.ngram = ngram
+        self.weights = {
+            "length": 1.0,
+            "overlap": 2.0,
+            "self_repeat": 1.0,
+            "banned": 0.1,
+        }
+        self.weights.update(weights or {})
+
+    def details(self, draft: dict, recent: list) -> dict:
+        """各项扣分，recent 为最近的正文段落"""
+        text = draft.get("段落", "")
+        length = len(text)
+        if length < self.min_length:
+            length_penalty = (self.min_length - length) / self.min_length
+        elif self.max_length and length > self.max_length:
+            length_penalty = (length - self.max_length) / self.max_length
+        else:
+            length_penalty = 0.0
+
+        grams = shingles(text, self.ngram)
+        total = max(len(text) - self.ngram + 1, 1)
+        seen = set()
+        for paragraph in recent:
+            if paragraph:
+                seen |= shingles(paragraph, self.ngram)
+        overlap = len(grams & seen) / max(len(grams), 1)
+        self_repeat = 1 - len(grams) / total if len(text) >= self.ngram else 0.0
+
+        return {
+            "missing": [k for k in self.required_keys if not draft.get(k)],
+            "length": min(length_penalty, 1.0),
+            "overlap": overlap,
+            "self_repeat": self_repeat,
+            "banned": sum(text.count(p) for p in self.banned_phrases),
+        }
+
+    def score(self, draft: dict, recent: list) -> float:
+        details = self.details(draft, recent)
+        if details["missing"]:
+            return -math.inf
+        return 1 - sum(self.weights[k] * details[k] for k in self.weights)
+
+
+class RepetitionDetector:
+    """
+    增量维护的近似重复检测，用于发现长时间连续写作中反复出现的场景与句子
+    - 每段正文去掉空白后取相邻 ngram 个字的片段哈希，记录每个哈希最后出现在第几段，
+      add 只处理新段落，check 的耗时只与新文本长度有关，与全书长度无关
+    - 只保留最近 window 段的哈希，更早的段落离开窗口时删除，内存与书长无关
+    - 哈希只在进程内使用，恢复会话时由 reset 从最近的段落重建
+    - overlap：新文本的片段中出现在最近 window 段内的比例
+    - self_repeat：新文本内部重复的片段比例
+    任一项超过 max_overlap / max_self_repeat 即判定为重复
+    """
+
+    def __init__(self, ngram=8, window=20, max_overlap=0.3, max_self_repeat=0.3):
+        self.ngram = ngram
+        self.window = window
+        self.max_overlap = max_overlap
+        self.max_self_repeat = max_self_repeat
+
+        self.lock = threading.Lock()
+        self.last_seen = {}
+        self.recent = deque()
+        self.paragraphs = 0
+
+    def hashes(self, text: str) -> list:
+        # 切片后用内置的字符串哈希，比逐字计算多项式滚动哈希快数倍
+        text = "".join(text.split())
+        n = self.ngram
+        return [hash(text[i : i + n]) for i in range(len(text) - n + 1)]
+
+    def add(self, paragraph: str):
+        hashes = set(self.hashes(paragraph))
+        with self.lock:
+            for h in hashes:
+                self.last_seen[h] = self.paragraphs
+            self.recent.append(hashes)
+            self.paragraphs += 1
+            oldest = self.paragraphs - self.window
+            while len(self.recent) > self.window:
+                # 之后又出现过的片段保留
+                for h in self.recent.popleft():
+                    if self.last_seen.get(h, oldest) < oldest:
+                        del self.last_seen[h]
+
+    def reset(self, paragraphs=()):
+        paragraphs = list(paragraphs)
+        with self.lock:
+            self.last_seen = {}
+            self.recent = deque()
+            self.paragraphs = max(len(paragraphs) - self.window, 0)
+        for paragraph in paragraphs[-self.window :] if self.window else ():
+            self.add(paragraph)
+
+    def check(self, text: str) -> dict:
+        hashes = self.hashes(text)
+        distinct = set(hashes)
+        with self.lock:
+            oldest = self.paragraphs - self.window
+            repeated = sum(
+                1 for h in distinct if h in self.last_seen and self.last_seen[h] >= oldest
+            )
+        overlap = repeated / len(distinct) if distinct else 0.0
+        self_repeat = 1 - len(distinct) / len(hashes) if hashes else 0.0
+        return {
+            "overlap": overlap,
+            "self_repeat": self_repeat,
+            "repetitive": overlap > self.max_overlap or self_repeat > self.max_self_repeat,
+        }
@@ -0,0 +1,128 @@
+import math
+import re
+import threading
+from collections import Counter
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """中文按相邻两字切分，英文与数字按整词"""
+    terms = []
+    for run in WORD_PATTERN.findall(text):
+        if run.isascii():
+            terms.append(run.lower())
+        elif len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def splitPassages(text: str, max_length=300) -> list:
+    """按行把正文切成不超过 max_length 字的片段，过长的行按长度切开"""
+    passages = []
+    current = ""
+    for line in text.split("\n"):
+        line = line.strip()
+        while len(line) > max_length:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(line[:max_length])
+            line = line[max_length:]
+        if not line:
+            continue
+        if current and len(current) + len(line) + 1 > max_length:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        passages.append(current)
+    return passages
+
+
+class PassageIndex:
+    """
+    正文与记忆片段的本地检索索引，BM25 打分
+    - add 时只更新新片段涉及的倒排表，不会重建整个索引
+    - search 只用查询中最少见的 max_query_terms 个词，查询耗时与查询长度无关
+    - position 记录片段出自第几段正文，search 可以按 position 跳过仍在上文中的段落
+    """
+
+    def __init__(self, k1=1.5, b=0.75, max_query_terms=64):
+        self.k1 = k1
+        self.b = b
+        self.max_query_terms = max_query_terms
+
+        self.lock = threading.Lock()
+        self.passages = []
+        self.sources = []
+        self.positions = []
+        self.lengths = []
+        self.total_length = 0
+        self.postings = {}
+
+    def __len__(self):
+        return len(self.passages)
+
+    def __getstate__(self):
+        # 锁不能复制，gr.State 会深拷贝初始值
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def add(self, text: str, source=None, position=None) -> int:
+        terms = Counter(tokenize(text))
+        with self.lock:
+            doc_id = len(self.passages)
+            self.passages.append(text)
+            self.sources.append(source)
+            self.positions.append(position)
+            length = sum(terms.values())
+            self.lengths.append(length)
+            self.total_length += length
+            for term, tf in terms.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        return doc_id
+
+    def idf(self, term) -> float:
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, k=3, exclude=None, before=None) -> list:
+        """
+        返回得分最高的 k 个 (score, text, source)
+        exclude(text, source) 返回 True 的片段会被跳过
+        before 不为空时跳过 position 不小于 before 的片段，例如已经在上文中的段落，没有 position 的片段不受影响
+        """
+        with self.lock:
+            if not self.passages:
+                return []
+            terms = [t for t in set(tokenize(query)) if t in self.postings]
+            terms = sorted(terms, key=self.idf, reverse=True)[: self.max_query_terms]
+            avg_length = self.total_length / len(self.passages) or 1
+
+            scores = {}
+            for term in terms:
+                idf = self.idf(term)
+                for doc_id, tf in self.postings[term]:
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+            results = []
+            for doc_id in sorted(scores, key=scores.get, reverse=True):
+                text, source = self.passages[doc_id], self.sources[doc_id]
+                position = self.positions[doc_id]
+                if before is not None and position is not None and position >= before:
+                    continue
+                if exclude is not None and exclude(text, source):
+                    continue
+                results.append((scores[doc_id], text, source))
+                if len(results) >= k:
+                    break
+            return results
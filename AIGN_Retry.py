@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+
+from uniai.errors import FatalError, RateLimitError, TransientError
+
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+PARSE = "parse"
+FATAL = "fatal"
+
+
+class ParseError(ValueError):
+    """
+    模型回复无法按约定格式解析
+    - sections：已经解析出的部分
+    - missing：缺少的 output_keys
+    """
+
+    def __init__(self, message, sections=None, missing=None):
+        super().__init__(message)
+        self.sections = sections or {}
+        self.missing = missing or []
+
+
+def classifyError(e: Exception) -> str:
+    """把异常归为 限流 / 临时错误 / 解析失败 / 致命错误 四类"""
+    if isinstance(e, RateLimitError):
+        return RATE_LIMIT
+    if isinstance(e, FatalError):
+        return FATAL
+    if isinstance(e, ParseError):
+        return PARSE
+    if isinstance(e, TransientError):
+        return TRANSIENT
+    status_code = getattr(e, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if isinstance(status_code, int) and (status_code in (408, 409) or status_code >= 500):
+        return TRANSIENT
+    # 网络中断与超时可以重试，其余无法识别的错误（多为程序错误）重试也不会成功
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    name = type(e).__name__
+    if "Timeout" in name or "Connection" in name:
+        return TRANSIENT
+    return FATAL
+
+
+class RetryPolicy:
+    """
+    指数退避 + 随机抖动（full jitter）的重试策略
+    - 限流、临时错误：等待 random(0, min(max_delay, base_delay * 2^n))，服务端给出 Retry-After 时至少等待该时长
+    - 解析失败：服务商本身没有问题，短暂等待后立即重试
+    - 致命错误：不重试
+    """
+
+    def __init__(
+        self,
+        max_retries=10,
+        base_delay=1.0,
+        max_delay=60.0,
+        parse_delay=0.5,
+        retryable=(RATE_LIMIT, TRANSIENT, PARSE),
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.parse_delay = parse_delay
+        self.retryable = retryable
+
+    def shouldRetry(self, error_class: str, attempt: int) -> bool:
+        return error_class in self.retryable and attempt + 1 < self.max_retries
+
+    def getDelay(self, error_class: str, attempt: int, retry_after=None) -> float:
+        if error_class == PARSE:
+            return random.uniform(0, self.parse_delay)
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    单个服务商的熔断器
+    连续 failure_threshold 次限流或临时错误后熔断 reset_timeout 秒，期间请求不会发出；
+    之后放行一个试探请求，成功则恢复，失败则继续熔断
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def allow(self) -> float:
+        """返回需要等待的秒数，0 表示可以发出请求"""
+        with self.lock:
+            if self.opened_at is None:
+                return 0.0
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return self.reset_timeout
+            self.probing = True
+            return 0.0
+
+    def recordSuccess(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def recordFailure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    def release(self):
+        """试探请求因与服务商可用性无关的原因结束，下次重新试探"""
+        with self.lock:
+            self.probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+
+breakers = {}
+breakers_lock = threading.Lock()
+
+
+def getBreaker(provider) -> CircuitBreaker:
+    """每个服务商共用一个熔断器"""
+    with breakers_lock:
+        if provider not in breakers:
+            breakers[provider] = CircuitBreaker()
+        return breakers[provider]
+
+
+def Retryer(func, max_retries=10, policy=None, breaker=None):
+    policy = policy or RetryPolicy(max_retries=max_retries)
+
+    def wrapper(*args, **kwargs):
+        last_error = None
+        for attempt in range(policy.max_retries):
+            if breaker is not None:
+                wait = breaker.allow()
+                if wait > 0:
+                    print("-" * 30 + f"\n熔断中，{wait:.1f} 秒后重试\n" + "-" * 30)
+                    time.sleep(wait)
+                    continue
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                last_error = e
+                error_class = classifyError(e)
+                if breaker is not None:
+                    if error_class in (RATE_LIMIT, TRANSIENT):
+                        breaker.recordFailure()
+                    elif error_class == PARSE:
+                        # 服务商正常返回了内容
+                        breaker.recordSuccess()
+                    else:
+                        breaker.release()
+                if not policy.shouldRetry(error_class, attempt):
+                    if error_class == FATAL:
+                        raise
+                    break
+                delay = policy.getDelay(
+                    error_class, attempt, getattr(e, "retry_after", None)
+                )
+                print(
+                    "-" * 30
+                    + f"\n失败（{error_class}）：\n{e}\n{delay:.1f} 秒后重试\n"
+                    + "-" * 30
+                )
+                time.sleep(delay)
+            else:
+                if breaker is not None:
+                    breaker.recordSuccess()
+                return result
+        raise ValueError("失败") from last_error
+
+    return wrapper
@@ -1,7 +1,25 @@
-from uniai import aliChatLLM, deepseekChatLLM, zhipuChatLLM
+import os
+
+from uniai import (
+    aliChatLLM,
+    deepseekChatLLM,
+    fakeChatLLM,
+    routerChatLLM,
+    zhipuChatLLM,
+)
 
 chatLLM = zhipuChatLLM(model_name="GLM-4", api_key="93c8238ebf3fe2cf702cbc1ce5ec4d1b.xqkKBB72dleCYIjs")
 
+# 使用多个服务商：按耗时与错误率选择后端，失败时自动换下一个；记忆总结固定用更便宜的模型
+# chatLLM = routerChatLLM(
+#     [chatLLM, deepseekChatLLM()],
+#     routes={"MemoryMaker": ["deepseek:deepseek-chat"]},
+# )
+
+# 设置环境变量 AIGN_FAKE_LLM=1 时使用本地的假模型，无需 API Key 即可运行 demo.py、app.py
+if os.environ.get("AIGN_FAKE_LLM"):
+    chatLLM = fakeChatLLM(latency=0.5, token_rate=200)
+
 if __name__ == "__main__":
 
     content = "请用一个成语介绍你自己"
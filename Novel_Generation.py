@@ -1,20 +1,12 @@
-import pandas as pd
 import time
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 
+from AIGN_Memory import MemoryWorker
 from AIGN_Prompt import *
-
-def Retryer(func, max_retries=10):
-    def wrapper(*args, **kwargs):
-        for _ in range(max_retries):
-            try:
-                return func(*args, **kwargs)
-            except Exception as e:
-                print("-" * 30 + f"\n失败：\n{e}\n" + "-" * 30)
-                time.sleep(2.333)
-        raise ValueError("失败")
-
-    return wrapper
+from AIGN_Retrieval import PassageIndex, splitPassages
+from AIGN_Retry import ParseError, Retryer, getBreaker
 
 class MarkdownAgent:
     """专门应对输入输出都是md格式的情况，例如小说生成"""
@@ -85,7 +77,7 @@ class MarkdownAgent:
         for k in output_keys:
             if k not in sections or not sections[k]:
                 print(f"错误：未能解析 {k} 在输出:\n{output}\n\n")
-                raise ValueError(f"fail to parse {k} in output:\n{output}\n\n")
+                raise ParseError(f"fail to parse {k} in output:\n{output}\n\n")
 
         return sections
 
@@ -95,7 +87,10 @@ class MarkdownAgent:
             if isinstance(v, str) and len(v) > 0:
                 input_content += f"# {k}\n{v}\n\n"
 
-        result = Retryer(self.getOutput)(input_content, output_keys)
+        result = Retryer(
+            self.getOutput,
+            breaker=getBreaker(getattr(self.chatLLM, "provider", None)),
+        )(input_content, output_keys)
 
         return result
 
@@ -103,10 +98,43 @@ class MarkdownAgent:
         if self.use_memory:
             self.history = self.history[:2]
 
+CHAPTER_PATTERN = re.compile(r"^第\s*\d+\s*章")
+
+
+def parse_chapter(text):
+    """把一章的规划解析为 {"outline", "ending", "paragraphs"}，没有段落大纲时整章作为一段"""
+    chapter = {"outline": "", "ending": "", "paragraphs": []}
+    rest = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line.startswith(("章节大纲：", "章节大纲:")):
+            chapter["outline"] = line[5:].strip()
+        elif line.startswith(("结尾：", "结尾:")):
+            chapter["ending"] = line[3:].strip()
+        elif line.startswith(("-", "*")) and line[1:].strip():
+            chapter["paragraphs"].append(line[1:].strip())
+        elif line:
+            rest.append(line)
+    if not chapter["outline"]:
+        chapter["outline"] = "\n".join(rest)
+    if not chapter["paragraphs"]:
+        chapter["paragraphs"] = [chapter["outline"]]
+    return chapter
+
+
 class AIGN:
-    def __init__(self, chatLLM):
+    def __init__(self, chatLLM, max_lag_paragraphs=3):
+        """剧情总结在后台进行，尚未总结的段落超过 max_lag_paragraphs 段时才等待"""
         self.chatLLM = chatLLM
         self.plot_summaries = []  # 用于存储多轮次的剧情总结
+        self.index = PassageIndex()  # 更早的剧情总结与正文的检索索引
+        # 空闲时每段都提交总结，总结期间写好的段落合并到下一次总结
+        self.memory_worker = MemoryWorker(
+            self.summarize_pending,
+            threshold=0,
+            max_lag_paragraphs=max_lag_paragraphs,
+            on_update=self.addSummary,
+        )
         self.global_plot_setting = "这是一个关于..."  # 全局剧情设定
         
         self.novel_writer = MarkdownAgent(
@@ -133,6 +161,12 @@ class AIGN:
             name="OutlineExpander",
             temperature=0.85,
         )
+        self.book_planner = MarkdownAgent(
+            chatLLM=self.chatLLM,
+            sys_prompt=book_planner_prompt,
+            name="BookPlanner",
+            temperature=0.85,
+        )
 
     def expand_outline(self, outline):
         """扩展章节或情节大纲"""
@@ -143,6 +177,14 @@ class AIGN:
         expanded_outline = resp["扩展"]
         return expanded_outline
 
+    def plan_book(self, outline):
+        """把整本书的大纲拆成 章节 -> 段落大纲 的规划"""
+        resp = self.book_planner.invoke(
+            inputs={"小说大纲": outline},
+            output_keys=["第1章"]
+        )
+        return [parse_chapter(v) for k, v in resp.items() if CHAPTER_PATTERN.match(k)]
+
     def extract_memory(self, text):
         """利用大模型从文本中提取剧情总结"""
         resp = self.memory_extractor.invoke(
@@ -153,13 +195,28 @@ class AIGN:
         return plot_summary
 
     def updateMemory(self, text):
-        """利用模型总结内容并更新剧情"""
-        new_summary = self.extract_memory(text)
+        """在后台利用模型总结内容并更新剧情"""
+        for passage in splitPassages(text):
+            self.index.add(passage, "正文")
+        self.memory_worker.add(text)
+
+    def summarize_pending(self, memory, pending):
+        """MemoryWorker 的总结函数，剧情总结只看新段落"""
+        return self.extract_memory(pending)
+
+    def addSummary(self, new_summary):
         self.plot_summaries.append(new_summary)  # 将新的剧情加入到多轮次剧情中
+        self.index.add(new_summary, "剧情")
+
+    def flush_memory(self):
+        """等待后台的剧情总结全部完成"""
+        self.memory_worker.flush()
 
     def generate_paragraph(self, chapter_outline, paragraph_outline):
         """生成段落并更新剧情"""
-        current_memory_summary = self.get_memory_summary()
+        current_memory_summary = self.get_memory_summary(
+            query=f"{chapter_outline}\n{paragraph_outline}"
+        )
         resp = self.novel_writer.invoke(
             inputs={
                 "章节大纲": chapter_outline,
@@ -174,7 +231,7 @@ class AIGN:
     
     def embellish_paragraph(self, paragraph, embellishment_idea):
         """润色给定的段落并更新剧情"""
-        current_memory_summary = self.get_memory_summary()
+        current_memory_summary = self.get_memory_summary(query=paragraph)
         resp = self.novel_embellisher.invoke(
             inputs={
                 "要润色的内容": paragraph,
@@ -187,14 +244,24 @@ class AIGN:
         self.updateMemory(embellished_paragraph)  # 更新剧情
         return embellished_paragraph
 
-    def get_memory_summary(self):
-        """获取当前的剧情记忆摘要，包括全局设定和多轮次的剧情总结"""
+    def get_memory_summary(self, query=None, k=3):
+        """获取当前的剧情记忆摘要，包括全局设定和多轮次的剧情总结，给出 query 时附上检索到的 k 个相关前文"""
+        self.memory_worker.poll()
+        recent_summaries = self.plot_summaries[-3:]  # 获取最近的3次剧情总结
         summary = self.global_plot_setting + "\n"
-        summary += "\n".join(self.plot_summaries[-3:])  # 获取最近的3次剧情总结
+        summary += "\n".join(recent_summaries)
+        if query:
+            passages = self.index.search(
+                query, k=k, exclude=lambda text, source: text in recent_summaries
+            )
+            if passages:
+                summary += "\n相关前文：\n"
+                summary += "\n".join(text for _, text, _ in passages)
         return summary
 
     def get_memory_data(self):
         """获取当前的记忆数据，返回字典格式"""
+        self.flush_memory()
         memory_data = {
             'global_plot_setting': self.global_plot_setting,
             'plot_summaries': self.plot_summaries
@@ -204,4 +271,95 @@ class AIGN:
     def load_memory_data(self, memory_data):
         """从字典数据中加载记忆"""
         self.global_plot_setting = memory_data.get('global_plot_setting', "这是一个关于...")
-        self.plot_summaries = memory_data.get('plot_summaries', [])
\ No newline at end of file
+        self.plot_summaries = memory_data.get('plot_summaries', [])
+        self.index = PassageIndex()
+        for plot_summary in self.plot_summaries:
+            self.index.add(plot_summary, "剧情")
+
+
+class BookPlanner:
+    """
+    按规划并行生成整本书
+    - plan 只在大纲变化时调用一次模型，得到 章节 -> 段落大纲 的规划
+    - 每一章以自己的章节大纲和上一章规划中的结尾状态开头，不依赖上一章的正文，因此各章可以同时生成；
+      章内每段依赖上一段的正文，按顺序生成
+    - 同时生成的章数不超过 max_concurrency，完成后按顺序拼接，并按章交给 aign 总结剧情
+    """
+
+    def __init__(self, aign, max_concurrency=4, context_length=500):
+        self.aign = aign
+        self.max_concurrency = max_concurrency
+        self.context_length = context_length
+        self.outline = None
+        self.chapters = []
+        self.chapter_texts = []
+
+    def plan(self, outline):
+        if outline != self.outline or not self.chapters:
+            self.chapters = self.aign.plan_book(outline)
+            self.outline = outline
+        return self.chapters
+
+    def render_plan(self):
+        content = ""
+        for i, chapter in enumerate(self.chapters):
+            content += f"第{i + 1}章：{chapter['outline']}\n"
+            content += "".join(f"  - {p}\n" for p in chapter["paragraphs"])
+            if chapter["ending"]:
+                content += f"  结尾：{chapter['ending']}\n"
+        return content
+
+    def handoff(self, i):
+        """上一章结束时的状态，第一章为全局设定"""
+        if i == 0:
+            return self.aign.global_plot_setting
+        previous = self.chapters[i - 1]
+        return previous["ending"] or previous["paragraphs"][-1]
+
+    def write_chapter(self, i, embellishment_idea=""):
+        chapter = self.chapters[i]
+        handoff = self.handoff(i)
+        paragraphs = []
+        for paragraph_outline in chapter["paragraphs"]:
+            previous_text = paragraphs[-1][-self.context_length:] if paragraphs else ""
+            resp = self.aign.novel_writer.invoke(
+                inputs={
+                    "章节大纲": chapter["outline"],
+                    "段落大纲": paragraph_outline,
+                    "前文剧情": handoff,
+                    "上文": previous_text,
+                },
+                output_keys=["段落"]
+            )
+            paragraph = resp["段落"]
+            if embellishment_idea:
+                resp = self.aign.novel_embellisher.invoke(
+                    inputs={
+                        "要润色的内容": paragraph,
+                        "润色要求": embellishment_idea,
+                        "前文剧情": handoff,
+                    },
+                    output_keys=["润色"]
+                )
+                paragraph = resp["润色"]
+            paragraphs.append(paragraph)
+        return "\n\n".join(paragraphs)
+
+    def run(self, outline, embellishment_idea=""):
+        """规划并生成整本书，返回按章节顺序拼接的正文"""
+        self.plan(outline)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            self.chapter_texts = list(
+                executor.map(
+                    lambda i: self.write_chapter(i, embellishment_idea),
+                    range(len(self.chapters)),
+                )
+            )
+        for text in self.chapter_texts:
+            self.aign.updateMemory(text)
+        return self.render_book()
+
+    def render_book(self):
+        return "\n\n".join(
+            f"第{i + 1}章\n\n{text}" for i, text in enumerate(self.chapter_texts)
+        )
@@ -1,7 +1,7 @@
 import gradio as gr
 import json
 import os
-from Novel_Generation import AIGN  # 假设 AIGN 在 Novel_Generation.py 中定义
+from Novel_Generation import AIGN, BookPlanner  # 假设 AIGN 在 Novel_Generation.py 中定义
 from LLM import chatLLM
 
 def generate_paragraph(aign, chapter_outline, paragraph_outline):
@@ -16,6 +16,13 @@ def embellish_paragraph(aign, paragraph, embellishment_idea):
     plot_summary = aign.get_memory_summary()  # 获取剧情总结
     return embellished_text, plot_summary
 
+def generate_book(aign, planner, outline, embellishment_idea):
+    """按大纲规划章节并同时生成各章，大纲不变时复用上一次的规划"""
+    if planner is None or planner.aign is not aign:
+        planner = BookPlanner(aign)
+    book = planner.run(outline, embellishment_idea)
+    return planner, planner.render_plan(), book, aign.get_memory_summary()
+
 def save_memory(aign):
     """保存当前记忆，提供一个可下载的文件"""
     memory_data = aign.get_memory_data()
@@ -42,6 +49,7 @@ def load_memory(aign, file_path):
 # 创建 Gradio 界面
 with gr.Blocks() as demo:
     aign_state = gr.State(AIGN(chatLLM))
+    planner_state = gr.State(None)
     gr.Markdown("## AI 小说写作助手")
 
     with gr.Row():
@@ -49,6 +57,7 @@ with gr.Blocks() as demo:
             outline_text = gr.Textbox(label="章节或情节大纲", lines=4, interactive=True)
             expanded_outline_text = gr.Textbox(label="扩展大纲", lines=8, interactive=False)
             expand_button = gr.Button("扩展大纲")
+            book_button = gr.Button("规划并生成整本书")
             
             chapter_outline_text = gr.Textbox(label="章节大纲", lines=4, interactive=True)
             paragraph_outline_text = gr.Textbox(label="段落大纲", lines=4, interactive=True)
@@ -65,6 +74,8 @@ with gr.Blocks() as demo:
 
         with gr.Column():
             plot_summary_output = gr.Textbox(label="剧情走向", lines=10, interactive=False)
+            book_plan_output = gr.Textbox(label="章节规划", lines=10, interactive=False)
+            book_output = gr.Textbox(label="整本书", lines=20, interactive=False)
 
     # 绑定扩展大纲事件
     expand_button.click(
@@ -73,6 +84,13 @@ with gr.Blocks() as demo:
         outputs=[expanded_outline_text]
     )
 
+    # 绑定生成整本书事件
+    book_button.click(
+        fn=generate_book,
+        inputs=[aign_state, planner_state, outline_text, embellishment_idea_text],
+        outputs=[planner_state, book_plan_output, book_output, plot_summary_output]
+    )
+
     # 绑定生成段落事件
     generate_button.click(
         fn=generate_paragraph, 
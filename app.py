@@ -1,4 +1,4 @@
-import random
+import queue
 import threading
 import time
 
@@ -7,95 +7,186 @@ import gradio as gr
 from AIGN import AIGN
 from LLM import chatLLM
 
-STREAM_INTERVAL = 0.
+# 合并这段时间内的更新后再发送给浏览器
+STREAM_INTERVAL = 0.1
 
-def make_middle_chat():
-    carrier = threading.Event()
-    carrier.history = []
+
+class UIChannel:
+    """
+    工作线程每有新内容就向队列推送一次，处理函数阻塞等待，没有新内容时不占用 CPU
+    - history 为聊天框的内容，由 middle_chat 在工作线程中更新
+    - run 在工作线程中运行 target，结束后推送 DONE
+    """
+
+    DONE = object()
+
+    def __init__(self, history):
+        self.history = history
+        self.queue = queue.Queue()
+        self.streaming = None
+
+    def getHistory(self):
+        """把正在流式输出的增量拼接进聊天框，每次发送前只拼接一次"""
+        if self.streaming is not None:
+            entry, deltas, total_tokens = self.streaming
+            entry[1] = f"total_tokens: {total_tokens}\n" + "".join(deltas)
+        return self.history
+
+    def push(self):
+        self.queue.put(None)
+
+    def run(self, target):
+        def worker():
+            try:
+                target()
+            finally:
+                self.queue.put(self.DONE)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def updates(self):
+        """每收到更新 yield 一次，STREAM_INTERVAL 内的多次更新合并为一次，工作线程结束后再 yield 最后一次"""
+        done = False
+        while not done:
+            done = self.queue.get() is self.DONE
+            deadline = time.monotonic() + STREAM_INTERVAL
+            while not done:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    done = self.queue.get(timeout=remaining) is self.DONE
+                except queue.Empty:
+                    break
+            yield
+
+
+def make_middle_chat(channel):
+    delta_mode = getattr(chatLLM, "supports_delta", False)
 
     def middle_chat(messages, temperature=None, top_p=None):
-        nonlocal carrier
-        carrier.history.append([None, ""])
-        if len(carrier.history) > 20:
-            carrier.history = carrier.history[-16:]
+        channel.history.append([None, ""])
+        if len(channel.history) > 20:
+            channel.history = channel.history[-16:]
+        entry = channel.history[-1]
+        channel.push()
+        deltas = []
+        total_tokens = None
         try:
-            for resp in chatLLM(
-                messages, temperature=temperature, top_p=top_p, stream=True
-            ):
+            if delta_mode:
+                for resp in chatLLM(
+                    messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stream=True,
+                    delta=True,
+                ):
+                    deltas.append(resp["delta"])
+                    total_tokens = resp["total_tokens"] or total_tokens
+                    channel.streaming = (entry, deltas, total_tokens)
+                    channel.push()
                 output_text = resp["content"]
-                total_tokens = resp["total_tokens"]
+            else:
+                for resp in chatLLM(
+                    messages, temperature=temperature, top_p=top_p, stream=True
+                ):
+                    output_text = resp["content"]
+                    total_tokens = resp["total_tokens"]
 
-                carrier.history[-1][1] = f"total_tokens: {total_tokens}\n{output_text}"
+                    entry[1] = f"total_tokens: {total_tokens}\n{output_text}"
+                    channel.push()
+            channel.streaming = None
+            entry[1] = f"total_tokens: {total_tokens}\n{output_text}"
+            channel.push()
             return {
                 "content": output_text,
                 "total_tokens": total_tokens,
             }
         except Exception as e:
-            carrier.history[-1][1] = f"Error: {e}"
+            channel.streaming = None
+            entry[1] = f"Error: {e}"
+            channel.push()
             raise e
 
-    return carrier, middle_chat
+    middle_chat.model_name = getattr(chatLLM, "model_name", None)
+    middle_chat.provider = getattr(chatLLM, "provider", None)
+
+    return middle_chat
+
+
+def stream_outputs(channel, get_outputs):
+    """只发送有变化的文本框与聊天框，没有变化的用 gr.update() 代替"""
+    sent = {}
+    for _ in channel.updates():
+        outputs = []
+        for i, value in enumerate(get_outputs()):
+            if isinstance(value, (str, list)):
+                snapshot = [list(m) for m in value] if isinstance(value, list) else value
+                if sent.get(i) == snapshot:
+                    value = gr.update()
+                else:
+                    sent[i] = snapshot
+            outputs.append(value)
+        yield outputs
+
+
+def get_session(aign):
+    """
+    gr.State 的初始值为 None，会话第一次点击时才创建 AIGN
+    AIGN 中的 agent 由所有会话共用，每个会话只保存小说状态与自己的 chatLLM
+    各会话不写追加式日志，以免争用同一个日志文件
+    """
+    if aign is None:
+        aign = AIGN(chatLLM, journal_path=None)
+    return aign
 
 
 def gen_ouline_button_clicked(aign, user_idea, history):
+    aign = get_session(aign)
     aign.user_idea = user_idea
 
-    carrier, middle_chat = make_middle_chat()
-    carrier.history = history
-    aign.novel_outline_writer.chatLLM = middle_chat
+    channel = UIChannel(history)
+    aign.novel_outline_writer.chatLLM = make_middle_chat(channel)
 
-    gen_ouline_thread = threading.Thread(target=aign.genNovelOutline)
-    gen_ouline_thread.start()
+    channel.run(aign.genNovelOutline)
 
-    while gen_ouline_thread.is_alive():
-        yield [
+    yield from stream_outputs(
+        channel,
+        lambda: [
             aign,
-            carrier.history,
+            channel.getHistory(),
             aign.novel_outline,
             gr.Button(visible=False),
-        ]
-        time.sleep(STREAM_INTERVAL)
-    yield [
-        aign,
-        carrier.history,
-        aign.novel_outline,
-        gr.Button(visible=False),
-    ]
+        ],
+    )
 
 
 def gen_beginning_button_clicked(
     aign, history, novel_outline, user_requriments, embellishment_idea
 ):
+    aign = get_session(aign)
     aign.novel_outline = novel_outline
     aign.user_requriments = user_requriments
     aign.embellishment_idea = embellishment_idea
 
-    carrier, middle_chat = make_middle_chat()
-    carrier.history = history
+    channel = UIChannel(history)
+    middle_chat = make_middle_chat(channel)
     aign.novel_beginning_writer.chatLLM = middle_chat
     aign.novel_embellisher.chatLLM = middle_chat
 
-    gen_beginning_thread = threading.Thread(target=aign.genBeginning)
-    gen_beginning_thread.start()
+    channel.run(aign.genBeginning)
 
-    while gen_beginning_thread.is_alive():
-        yield [
+    yield from stream_outputs(
+        channel,
+        lambda: [
             aign,
-            carrier.history,
+            channel.getHistory(),
             aign.writing_plan,
             aign.temp_setting,
             aign.novel_content,
             gr.Button(visible=False),
-        ]
-        time.sleep(STREAM_INTERVAL)
-    yield [
-        aign,
-        carrier.history,
-        aign.writing_plan,
-        aign.temp_setting,
-        aign.novel_content,
-        gr.Button(visible=False),
-    ]
+        ],
+    )
 
 
 def gen_next_paragraph_button_clicked(
@@ -109,6 +200,7 @@ def gen_next_paragraph_button_clicked(
     user_requriments,
     embellishment_idea,
 ):
+    aign = get_session(aign)
     aign.user_idea = user_idea
     aign.novel_outline = novel_outline
     aign.writing_memory = writing_memory
@@ -117,35 +209,31 @@ def gen_next_paragraph_button_clicked(
     aign.user_requriments = user_requriments
     aign.embellishment_idea = embellishment_idea
 
-    carrier, middle_chat = make_middle_chat()
-    carrier.history = history
+    channel = UIChannel(history)
+    middle_chat = make_middle_chat(channel)
     aign.novel_writer.chatLLM = middle_chat
     aign.novel_embellisher.chatLLM = middle_chat
     aign.memory_maker.chatLLM = middle_chat
 
-    gen_next_paragraph_thread = threading.Thread(target=aign.genNextParagraph)
-    gen_next_paragraph_thread.start()
+    def gen_next_paragraph():
+        aign.genNextParagraph()
+        # 在返回前等待后台的记忆总结，记忆文本框显示的就是最新的记忆，
+        # 用户修改后下一次点击写回时不会被之后完成的总结覆盖
+        aign.updateMemory()
+
+    channel.run(gen_next_paragraph)
 
-    while gen_next_paragraph_thread.is_alive():
-        yield [
+    yield from stream_outputs(
+        channel,
+        lambda: [
             aign,
-            carrier.history,
+            channel.getHistory(),
             aign.writing_plan,
             aign.temp_setting,
             aign.writing_memory,
             aign.novel_content,
-            gr.Button(visible=False),
-        ]
-        time.sleep(STREAM_INTERVAL)
-    yield [
-        aign,
-        carrier.history,
-        aign.writing_plan,
-        aign.temp_setting,
-        aign.writing_memory,
-        aign.novel_content,
-        gr.Button(visible=False),
-    ]
+        ],
+    )
 
 
 css = """
@@ -167,7 +255,8 @@ css = """
 """
 
 with gr.Blocks(css=css) as demo:
-    aign = gr.State(AIGN(chatLLM))
+    # 不在这里创建 AIGN：gr.State 的初始值会为每个会话深拷贝一次
+    aign = gr.State(None)
     gr.Markdown("## AI 写小说 Demo")
     with gr.Row():
         with gr.Column(scale=0, elem_id="row1"):
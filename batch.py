@@ -0,0 +1,30 @@
+import argparse
+
+from AIGN_Batch import BatchRunner
+from ideas import idea_list
+from LLM import chatLLM
+
+# python batch.py --target-length 50000 --max-concurrency 8 --tpm 200000
+# 同时创作 ideas.py 中的所有小说，中断后重新运行会从 novels/ 下的日志继续
+parser = argparse.ArgumentParser()
+parser.add_argument("--output-dir", default="novels")
+parser.add_argument("--target-length", type=int, default=100000, help="每本书的字数")
+parser.add_argument("--max-concurrency", type=int, default=4, help="同时进行的请求数")
+parser.add_argument("--tpm", type=int, default=None, help="每分钟 token 预算")
+parser.add_argument(
+    "--max-parallel-books", type=int, default=None, help="同时在写的书的数量，默认全部"
+)
+args = parser.parse_args()
+
+runner = BatchRunner(
+    chatLLM,
+    idea_list,
+    output_dir=args.output_dir,
+    target_length=args.target_length,
+    max_concurrency=args.max_concurrency,
+    tokens_per_minute=args.tpm,
+    max_parallel_books=args.max_parallel_books,
+    pipelined=True,
+)
+for book in runner.run():
+    print(book)
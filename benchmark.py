@@ -0,0 +1,177 @@
+"""
+离线基准测试，使用 uniai.fakeChatLLM，不需要 API Key
+
+python benchmark.py          完整测试
+python benchmark.py --quick  只跑较短的书
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from AIGN import AIGN, MarkdownStreamParser
+from AIGN_Metrics import MetricsRecorder
+from ideas import idea_list
+from Novel_Generation import AIGN as ChapterAIGN
+from uniai import fakeChatLLM
+
+
+def makeAIGN(tmp_dir, **kwargs):
+    llm_kwargs = {
+        k: kwargs.pop(k)
+        for k in list(kwargs)
+        if k in ("latency", "token_rate", "failure_rate", "parse_failure_rate")
+    }
+    aign = AIGN(
+        fakeChatLLM(seed=0, **llm_kwargs),
+        journal_path=os.path.join(tmp_dir, "novel_record.journal"),
+        record_path=os.path.join(tmp_dir, "novel_record.md"),
+        **kwargs,
+    )
+    aign.genNovelOutline(idea_list[0])
+    aign.genBeginning()
+    return aign
+
+
+def benchThroughput(num_paragraphs, latency, token_rate):
+    """模拟真实延迟下每分钟生成的段落数，对比顺序、顺序流式与流水线模式"""
+    print(f"\n## genNextParagraph 吞吐（latency={latency}s, token_rate={token_rate}/s）")
+    print("| 模式 | 段落数 | 段落/分钟 | 秒/段落 |")
+    print("| --- | --- | --- | --- |")
+    modes = [
+        ("顺序", {}),
+        ("顺序（流式）", {"stream": True}),
+        ("流水线", {"pipelined": True}),
+    ]
+    for mode, kwargs in modes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            aign = makeAIGN(
+                tmp_dir, latency=latency, token_rate=token_rate, **kwargs
+            )
+            start = time.perf_counter()
+            for _ in range(num_paragraphs):
+                aign.genNextParagraph()
+            aign.flushPipeline()
+            elapsed = time.perf_counter() - start
+        print(
+            f"| {mode} | {num_paragraphs} | {num_paragraphs / elapsed * 60:.1f} "
+            f"| {elapsed / num_paragraphs:.3f} |"
+        )
+
+
+def benchScaling(checkpoints, window=10):
+    """模型零延迟时每段的本地开销与内存随书长的变化"""
+    print("\n## genNextParagraph 本地开销随书长的变化（模型零延迟）")
+    print("| 书长（段） | 字数 | 毫秒/段落 | 当前内存 MB | 峰值内存 MB |")
+    print("| --- | --- | --- | --- | --- |")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        aign = makeAIGN(tmp_dir)
+        tracemalloc.start()
+        for checkpoint in checkpoints:
+            while len(aign.paragraph_list) < checkpoint - window:
+                aign.genNextParagraph()
+            start = time.perf_counter()
+            for _ in range(window):
+                aign.genNextParagraph()
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            print(
+                f"| {len(aign.paragraph_list)} | {len(aign.novel_text)} "
+                f"| {elapsed / window * 1000:.2f} | {current / 2**20:.1f} | {peak / 2**20:.1f} |"
+            )
+        tracemalloc.stop()
+
+
+def benchParser(repeats=2000, chunk_size=8):
+    """解析一次回复的开销，整段输入与按流式增量输入"""
+    llm = fakeChatLLM(seed=0)
+    from AIGN_Prompt import novel_writer_prompt
+
+    content = llm([{"role": "user", "content": novel_writer_prompt}])["content"]
+    output_keys = ["段落", "计划", "临时设定"]
+    chunks = [content[i : i + chunk_size] for i in range(0, len(content), chunk_size)]
+
+    print(f"\n## MarkdownStreamParser 开销（回复 {len(content)} 字）")
+    print("| 输入方式 | 微秒/回复 |")
+    print("| --- | --- |")
+    for name, pieces in (("整段", [content]), (f"每 {chunk_size} 字", chunks)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            parser = MarkdownStreamParser(output_keys)
+            for piece in pieces:
+                parser.feed(piece)
+            parser.close()
+        elapsed = time.perf_counter() - start
+        print(f"| {name} | {elapsed / repeats * 1e6:.1f} |")
+
+
+def benchRetry(num_paragraphs):
+    """注入失败后的额外 token 与耗时"""
+    print(f"\n## 重试开销（{num_paragraphs} 段）")
+    print("| 注入 | 重试次数 | 总 tokens | 额外 tokens | 耗时 s |")
+    print("| --- | --- | --- | --- | --- |")
+    baseline = None
+    for name, failures in (
+        ("无", {}),
+        ("缺少 # key 30%", {"parse_failure_rate": 0.3}),
+        ("临时错误 10%", {"failure_rate": 0.1}),
+    ):
+        metrics = MetricsRecorder()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 不输出重试日志
+            with contextlib.redirect_stdout(io.StringIO()):
+                aign = makeAIGN(tmp_dir, metrics=metrics, **failures)
+                start = time.perf_counter()
+                for _ in range(num_paragraphs):
+                    aign.genNextParagraph()
+                elapsed = time.perf_counter() - start
+        summary = metrics.summary().values()
+        retries = sum(s["retries"] for s in summary)
+        tokens = sum(s["total_tokens"] for s in summary)
+        if baseline is None:
+            baseline = tokens
+        print(
+            f"| {name} | {retries:g} | {tokens:g} | {tokens - baseline:+g} | {elapsed:.2f} |"
+        )
+
+
+def benchChapterGeneration(lengths):
+    """Novel_Generation.AIGN.generate_paragraph 随段落数的耗时"""
+    print("\n## Novel_Generation.generate_paragraph（模型零延迟）")
+    print("| 段落数 | 毫秒/段落 | 剧情记忆条数 |")
+    print("| --- | --- | --- |")
+    for length in lengths:
+        aign = ChapterAIGN(fakeChatLLM(seed=0))
+        # Novel_Generation 会打印每次模型输出
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for i in range(length):
+                aign.generate_paragraph("第一章", f"第{i + 1}段")
+            elapsed = time.perf_counter() - start
+            aign.flush_memory()
+        print(
+            f"| {length} | {elapsed / length * 1000:.2f} | {len(aign.plot_summaries)} |"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="只跑较短的书")
+    args = parser.parse_args()
+
+    if args.quick:
+        benchThroughput(4, latency=0.05, token_rate=20000)
+        benchScaling([20, 50])
+        benchParser(repeats=200)
+        benchRetry(10)
+        benchChapterGeneration([10, 50])
+    else:
+        benchThroughput(10, latency=0.2, token_rate=5000)
+        benchScaling([50, 200, 1000])
+        benchParser()
+        benchRetry(20)
+        benchChapterGeneration([10, 100, 500])
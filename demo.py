@@ -1,8 +1,18 @@
+import os
+import sys
+
 from AIGN import AIGN
 from ideas import idea_list
 from LLM import chatLLM
 
-aign = AIGN(chatLLM)
+# python demo.py --resume 从 novel_record.journal 继续上一次中断的写作
+if "--resume" in sys.argv and os.path.exists("novel_record.journal"):
+    aign = AIGN.resume(
+        "novel_record.journal", chatLLM, pipelined=True, repetition=True
+    )
+else:
+    # 不加 --resume 时开始一部新小说，覆盖之前的日志
+    aign = AIGN(chatLLM, pipelined=True, repetition=True, overwrite_journal=True)
 
 user_idea = idea_list[1]
 user_requriments = "主角独自一人行动。非常重要！主角不要有朋友！！！"
@@ -14,8 +24,10 @@ user_requriments = "主角独自一人行动。非常重要！主角不要有朋
 # - 在正文中添加表情包：😂😅😘💕😍👍
 # """
 
-aign.genNovelOutline(user_idea)
-aign.genBeginning(user_requriments)
+if not aign.novel_outline:
+    aign.genNovelOutline(user_idea)
+if not aign.paragraph_list:
+    aign.genBeginning(user_requriments)
 
 while 1:
     aign.genNextParagraph()
@@ -1,3 +1,20 @@
-from .aliAI import aliChatLLM
-from .deepseekAI import deepseekChatLLM
-from .zhipuAI import zhipuChatLLM
+import importlib
+
+from .fakeAI import fakeChatLLM
+from .router import ChatRouter, routerChatLLM
+
+# 各家后端按需导入，只用 fakeChatLLM 或 uniai.errors 时不需要安装所有 SDK
+LAZY_EXPORTS = {
+    "aliAsyncChatLLM": ".aliAI",
+    "aliChatLLM": ".aliAI",
+    "deepseekAsyncChatLLM": ".deepseekAI",
+    "deepseekChatLLM": ".deepseekAI",
+    "zhipuAsyncChatLLM": ".zhipuAI",
+    "zhipuChatLLM": ".zhipuAI",
+}
+
+
+def __getattr__(name):
+    if name not in LAZY_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(LAZY_EXPORTS[name], __name__), name)
@@ -4,6 +4,10 @@ from http import HTTPStatus
 
 import dashscope
 
+from .asyncAI import asyncChatLLM
+from .errors import errorFromStatus, iterResponses, wrapError
+from .streaming import cachedTokens, streamChunks
+
 
 def aliChatLLM(model_name, api_key=None):
     """
@@ -13,6 +17,8 @@ def aliChatLLM(model_name, api_key=None):
     - qwen1.5-72b-chat
     - qwen-turbo
     - qwen-max
+
+    stream=True, delta=True 时只输出增量，最后输出一次完整内容，见 streaming.streamChunks
     """
     api_key = os.environ.get("ALI_AI_API_KEY", api_key)
 
@@ -21,22 +27,29 @@ def aliChatLLM(model_name, api_key=None):
         temperature=0.85,
         top_p=0.8,
         stream=False,
+        delta=False,
     ) -> dict:
         if not stream:
-            response = dashscope.Generation.call(
-                model=model_name,
-                api_key=api_key,
-                messages=messages,
-                seed=random.randint(1, 10000),
-                temperature=temperature,
-                top_p=top_p,
-                result_format="message",
-            )
+            try:
+                response = dashscope.Generation.call(
+                    model=model_name,
+                    api_key=api_key,
+                    messages=messages,
+                    seed=random.randint(1, 10000),
+                    temperature=temperature,
+                    top_p=top_p,
+                    result_format="message",
+                )
+            except Exception as e:
+                raise wrapError(e)
             if response.status_code == HTTPStatus.OK:
                 return {
                     "content": response.output.choices[0].message.content,
                     "total_tokens": response.usage.input_tokens
                     + response.usage.output_tokens,
+                    "prompt_tokens": response.usage.input_tokens,
+                    "completion_tokens": response.usage.output_tokens,
+                    "cached_tokens": cachedTokens(response.usage),
                 }
             else:
                 error_info = (
@@ -48,27 +61,34 @@ def aliChatLLM(model_name, api_key=None):
                         response.message,
                     )
                 )
-                raise ValueError(f"Error in response: {error_info}")
+                raise errorFromStatus(
+                    response.status_code, f"Error in response: {error_info}"
+                )
         else:
-            responses = dashscope.Generation.call(
-                model=model_name,
-                api_key=api_key,
-                messages=messages,
-                seed=random.randint(1, 10000),
-                temperature=temperature,
-                top_p=top_p,
-                result_format="message",
-                stream=True,
-                output_in_full=True,  # get streaming output incrementally
-            )
+            try:
+                responses = dashscope.Generation.call(
+                    model=model_name,
+                    api_key=api_key,
+                    messages=messages,
+                    seed=random.randint(1, 10000),
+                    temperature=temperature,
+                    top_p=top_p,
+                    result_format="message",
+                    stream=True,
+                    incremental_output=True,  # 每次只返回增量，完整内容在本地拼接
+                )
+            except Exception as e:
+                raise wrapError(e)
 
-            def respGenerator():
-                for response in responses:
+            def pieces():
+                for response in iterResponses(responses):
                     if response.status_code == HTTPStatus.OK:
-                        yield {
-                            "content": response.output.choices[0]["message"]["content"],
+                        yield response.output.choices[0]["message"]["content"], {
                             "total_tokens": response.usage.input_tokens
                             + response.usage.output_tokens,
+                            "prompt_tokens": response.usage.input_tokens,
+                            "completion_tokens": response.usage.output_tokens,
+                            "cached_tokens": cachedTokens(response.usage),
                         }
                     else:
                         error_info = (
@@ -80,8 +100,31 @@ def aliChatLLM(model_name, api_key=None):
                                 response.message,
                             )
                         )
-                        raise ValueError(f"Error in response: {error_info}")
+                        raise errorFromStatus(
+                            response.status_code, f"Error in response: {error_info}"
+                        )
 
-            return respGenerator()
+            return streamChunks(pieces(), delta)
         
+    chatLLM.model_name = model_name
+    chatLLM.provider = "ali"
+    chatLLM.supports_delta = True
+
     return chatLLM
+
+
+def aliAsyncChatLLM(model_name, api_key=None, max_concurrency=8):
+    """
+    aliChatLLM 的异步版本，参数与返回值相同，调用时需要 await
+    - max_concurrency：同时进行的请求数上限
+
+    流式输出：async for resp in await chatLLM(messages, stream=True)
+    """
+    api_key = os.environ.get("ALI_AI_API_KEY", api_key)
+    return asyncChatLLM(
+        model_name,
+        api_key=api_key,
+        provider="ali",
+        base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        max_concurrency=max_concurrency,
+    )
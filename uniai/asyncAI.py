@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+from openai import AsyncOpenAI
+
+from .errors import wrapError
+from .streaming import asyncStreamChunks, usageDict
+
+
+def asyncChatLLM(model_name, api_key, base_url, provider=None, max_concurrency=8):
+    """
+    OpenAI 兼容接口的异步 chatLLM
+    - 同一个 chatLLM 的所有调用共用一个 httpx 连接池，不会每次请求都重新握手
+    - max_concurrency 限制同时进行的请求数，超出的请求会排队等待
+
+    注意：连接池和信号量会绑定到首次使用它们的事件循环，请在同一个事件循环中使用。
+    """
+    client = AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            ),
+        ),
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def chatLLM(
+        messages: list,
+        temperature=None,
+        top_p=None,
+        max_tokens=None,
+        stream=False,
+        delta=False,
+    ) -> dict:
+        if not stream:
+            async with semaphore:
+                try:
+                    response = await client.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        temperature=temperature,
+                        top_p=top_p,
+                        max_tokens=max_tokens,
+                    )
+                except Exception as e:
+                    raise wrapError(e)
+            return {
+                "content": response.choices[0].message.content,
+                **usageDict(response.usage),
+            }
+        else:
+
+            async def respGenerator():
+                # 流式请求在整个读取过程中都占用一个并发名额
+                async with semaphore:
+                    try:
+                        responses = await client.chat.completions.create(
+                            model=model_name,
+                            messages=messages,
+                            temperature=temperature,
+                            top_p=top_p,
+                            max_tokens=max_tokens,
+                            stream=True,
+                        )
+
+                        async def pieces():
+                            async for response in responses:
+                                text = ""
+                                if response.choices:
+                                    text = response.choices[0].delta.content or ""
+                                yield text, usageDict(getattr(response, "usage", None))
+
+                        async for chunk in asyncStreamChunks(pieces(), delta):
+                            yield chunk
+                    except Exception as e:
+                        raise wrapError(e)
+
+            return respGenerator()
+
+    chatLLM.model_name = model_name
+    chatLLM.provider = provider
+    chatLLM.supports_delta = True
+    chatLLM.client = client
+    chatLLM.semaphore = semaphore
+
+    return chatLLM
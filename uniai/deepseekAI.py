@@ -2,11 +2,17 @@ import os
 
 from openai import OpenAI
 
+from .asyncAI import asyncChatLLM
+from .errors import iterResponses, wrapError
+from .streaming import openaiPieces, streamChunks, usageDict
+
 
 def deepseekChatLLM(model_name="deepseek-chat", api_key=None):
     """
     model_name 取值
     - deepseek-chat
+
+    stream=True, delta=True 时只输出增量，最后输出一次完整内容，见 streaming.streamChunks
     """
     api_key = os.environ.get("DEEPSEEK_AI_API_KEY", api_key)
     client = OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
@@ -17,45 +23,59 @@ def deepseekChatLLM(model_name="deepseek-chat", api_key=None):
         top_p=None,
         max_tokens=None,
         stream=False,
+        delta=False,
     ) -> dict:
         if not stream:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-            )
+            try:
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                )
+            except Exception as e:
+                raise wrapError(e)
             return {
                 "content": response.choices[0].message.content,
-                "total_tokens": response.usage.total_tokens,
+                **usageDict(response.usage),
             }
         else:
-            responses = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-                stream=True,
-            )
-
-            def respGenerator():
-                content = ""
-                for response in responses:
-                    delta = response.choices[0].delta.content
-                    content += delta
-
-                    # if response.usage:
-                    #     total_tokens = response.usage.total_tokens
-                    # else:
-                    total_tokens = None
-
-                    yield {
-                        "content": content,
-                        "total_tokens": total_tokens,
-                    }
-
-            return respGenerator()
+            try:
+                responses = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    # 最后一个分块返回 token 用量，包括 prompt_cache_hit_tokens
+                    stream_options={"include_usage": True},
+                )
+            except Exception as e:
+                raise wrapError(e)
+
+            return streamChunks(openaiPieces(iterResponses(responses)), delta)
+
+    chatLLM.model_name = model_name
+    chatLLM.provider = "deepseek"
+    chatLLM.supports_delta = True
 
     return chatLLM
+
+
+def deepseekAsyncChatLLM(model_name="deepseek-chat", api_key=None, max_concurrency=8):
+    """
+    deepseekChatLLM 的异步版本，参数与返回值相同，调用时需要 await
+    - max_concurrency：同时进行的请求数上限
+
+    流式输出：async for resp in await chatLLM(messages, stream=True)
+    """
+    api_key = os.environ.get("DEEPSEEK_AI_API_KEY", api_key)
+    return asyncChatLLM(
+        model_name,
+        api_key=api_key,
+        provider="deepseek",
+        base_url="https://api.deepseek.com",
+        max_concurrency=max_concurrency,
+    )
@@ -0,0 +1,69 @@
+class LLMError(Exception):
+    """
+    uniai 统一的请求错误
+    - retry_after：服务端建议的重试等待秒数（来自 Retry-After 响应头），没有则为 None
+    - status_code：HTTP 状态码，没有则为 None
+    """
+
+    def __init__(self, message, retry_after=None, status_code=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class RateLimitError(LLMError):
+    """触发限流（HTTP 429），稍后重试可以成功"""
+
+
+class TransientError(LLMError):
+    """网络中断、超时、服务端 5xx 等临时错误"""
+
+
+class FatalError(LLMError):
+    """API Key 无效、请求参数错误等重试也不会成功的错误"""
+
+
+def errorFromStatus(status_code, message, retry_after=None) -> LLMError:
+    if status_code == 429:
+        error_class = RateLimitError
+    elif status_code in (408, 409) or status_code >= 500:
+        error_class = TransientError
+    else:
+        error_class = FatalError
+    return error_class(message, retry_after=retry_after, status_code=status_code)
+
+
+def getRetryAfter(e):
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def wrapError(e: Exception) -> Exception:
+    """把各家 SDK 抛出的异常转换为 LLMError，无法识别的异常原样返回"""
+    if isinstance(e, LLMError):
+        return e
+
+    status_code = getattr(e, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(e, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        return errorFromStatus(status_code, str(e), retry_after=getRetryAfter(e))
+
+    name = type(e).__name__
+    if "Timeout" in name or "Connection" in name:
+        return TransientError(str(e))
+    return e
+
+
+def iterResponses(responses):
+    """迭代流式响应，把迭代过程中抛出的异常转换为 LLMError"""
+    try:
+        yield from responses
+    except Exception as e:
+        raise wrapError(e)
@@ -0,0 +1,161 @@
+import random
+import re
+import threading
+import time
+
+from .errors import RateLimitError, TransientError
+from .streaming import streamChunks
+
+LONG_KEYS = ["段落", "开头", "润色结果", "润色", "大纲", "新的记忆", "扩展"]
+
+PHRASES = [
+    "夜色沉沉",
+    "风从山口灌进来",
+    "他握紧了手中的剑",
+    "远处传来一声闷响",
+    "少女抬起头",
+    "灯火忽明忽暗",
+    "石阶上落满了枯叶",
+    "空气里有铁锈的味道",
+    "人群忽然安静下来",
+    "他想起了那封信",
+    "雨点砸在瓦片上",
+    "老人缓缓摇头",
+    "门外的脚步声越来越近",
+    "天边泛起鱼肚白",
+    "那道目光冷得像冰",
+    "她轻声笑了",
+    "城墙上的旗帜猎猎作响",
+    "没有人回答",
+    "刀锋映出一张苍白的脸",
+    "钟声在山谷里回荡",
+]
+
+
+def findOutputKeys(messages: list) -> list:
+    """从提示词的输出格式中找出需要输出的 # key"""
+    for message in [messages[-1], messages[0]]:
+        content = message["content"]
+        for block in re.findall(r"```[^\n]*\n(.*?)```", content, re.S):
+            keys = [
+                line[2:].strip()
+                for line in block.split("\n")
+                if line.startswith("# ") and line[2:].strip() != "END"
+            ]
+            if keys:
+                return keys
+    # Novel_Generation 的提示词：使用'#段落'进行标记
+    return re.findall(r"'#(\S+?)'", messages[0]["content"]) or ["段落"]
+
+
+def fakeChatLLM(
+    model_name="fake",
+    latency=0.0,
+    token_rate=None,
+    chunk_size=8,
+    failure_rate=0.0,
+    rate_limit_rate=0.0,
+    parse_failure_rate=0.0,
+    paragraph_length=800,
+    seed=None,
+):
+    """
+    不需要 API Key 的本地 chatLLM，用于离线演示、测试与基准测试
+    - latency：首个 token 之前的等待秒数
+    - token_rate：每秒输出的 token 数（按一个字一个 token 计），None 表示不限速
+    - chunk_size：流式输出时每次输出的字数
+    - failure_rate / rate_limit_rate：请求以 TransientError / RateLimitError 失败的概率
+    - parse_failure_rate：回复中随机缺少一个 # key 的概率
+    - paragraph_length：正文类 # key（段落、润色结果等）的字数
+    返回的 cached_tokens 模拟服务商的前缀缓存：与之前某次请求开头相同的完整消息计为命中
+    回复按提示词中的输出格式生成，例如 # 段落 / # 计划 / # 临时设定
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    seen_prefixes = set()
+
+    def makeText(length):
+        with lock:
+            sentences = []
+            while sum(len(s) + 1 for s in sentences) < length:
+                sentences.append(rng.choice(PHRASES) + rng.choice("，。！？"))
+                if rng.random() < 0.2:
+                    sentences.append("\n")
+            return "".join(sentences)
+
+    def makeContent(messages):
+        keys = findOutputKeys(messages)
+        with lock:
+            if len(keys) > 1 and rng.random() < parse_failure_rate:
+                dropped = rng.choice(keys)
+                keys = [k for k in keys if k != dropped]
+        content = ""
+        for k in keys:
+            length = paragraph_length if k in LONG_KEYS else 60
+            content += f"# {k}\n{makeText(length).strip()}\n"
+        return content + "# END\n"
+
+    def countCachedTokens(messages):
+        cached = 0
+        prefix = ()
+        with lock:
+            for m in messages:
+                prefix = hash((prefix, m["role"], m["content"]))
+                if prefix not in seen_prefixes:
+                    break
+                cached += len(m["content"])
+            prefix = ()
+            for m in messages:
+                prefix = hash((prefix, m["role"], m["content"]))
+                seen_prefixes.add(prefix)
+            if len(seen_prefixes) > 4096:
+                seen_prefixes.clear()
+        return cached
+
+    def checkFailure():
+        with lock:
+            r = rng.random()
+        if r < rate_limit_rate:
+            raise RateLimitError("fake rate limit", retry_after=latency, status_code=429)
+        if r < rate_limit_rate + failure_rate:
+            raise TransientError("fake transient error", status_code=503)
+
+    def chatLLM(
+        messages: list,
+        temperature=None,
+        top_p=None,
+        max_tokens=None,
+        stream=False,
+        delta=False,
+    ) -> dict:
+        checkFailure()
+        content = makeContent(messages)
+        prompt_tokens = sum(len(m["content"]) for m in messages)
+        usage = {
+            "total_tokens": prompt_tokens + len(content),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content),
+            "cached_tokens": countCachedTokens(messages),
+        }
+
+        if not stream:
+            time.sleep(latency + (len(content) / token_rate if token_rate else 0))
+            return {"content": content, **usage}
+        else:
+
+            def pieces():
+                time.sleep(latency)
+                for i in range(0, len(content), chunk_size):
+                    chunk = content[i : i + chunk_size]
+                    if token_rate:
+                        time.sleep(len(chunk) / token_rate)
+                    last = i + chunk_size >= len(content)
+                    yield chunk, usage if last else None
+
+            return streamChunks(pieces(), delta)
+
+    chatLLM.model_name = model_name
+    chatLLM.provider = "fake"
+    chatLLM.supports_delta = True
+
+    return chatLLM
@@ -0,0 +1,220 @@
+import threading
+import time
+
+from .errors import RateLimitError
+
+
+class Backend:
+    """路由中的一个 chatLLM 及其滚动统计"""
+
+    def __init__(self, chatLLM, cost=None):
+        self.chatLLM = chatLLM
+        self.name = f"{getattr(chatLLM, 'provider', None)}:{getattr(chatLLM, 'model_name', None)}"
+        self.cost = getattr(chatLLM, "cost", None) if cost is None else cost
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    def score(self) -> float:
+        """越小越好：考虑平均耗时、正在进行的请求数与错误率，没有样本的后端优先尝试"""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + self.in_flight) / max(1 - self.error_rate, 0.05)
+
+
+class ChatRouter:
+    """
+    由多个 uniai chatLLM 组成的路由，本身也可以当作 chatLLM 使用
+    - 每个后端记录耗时与错误率的指数滑动平均（权重 alpha）
+    - prefer="latency" 时选择综合耗时最低的后端，prefer="cost" 时选择 cost 最低的后端
+    - 请求失败时换下一个后端重试；限流或连续失败 max_failures 次的后端冷却 cooldown 秒
+      （服务端给出 Retry-After 时按其时长）
+    - routes 按 agent 名限定可用的后端，例如 {"MemoryMaker": ["deepseek:deepseek-chat"]}，
+      MarkdownAgent 会通过 for_agent(name) 取得对应的 chatLLM
+    后端名为 "provider:model_name"
+    """
+
+    def __init__(
+        self,
+        backends,
+        routes=None,
+        prefer="latency",
+        alpha=0.2,
+        cooldown=30.0,
+        max_failures=3,
+    ):
+        """backends 为 chatLLM 或 (chatLLM, cost) 的列表"""
+        self.backends = []
+        for backend in backends:
+            if isinstance(backend, tuple):
+                self.backends.append(Backend(*backend))
+            else:
+                self.backends.append(Backend(backend))
+        self.routes = routes or {}
+        self.prefer = prefer
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self.max_failures = max_failures
+        self.lock = threading.Lock()
+
+        names = {b.name for b in self.backends}
+        for agent, route in self.routes.items():
+            unknown = set(route) - names
+            if unknown:
+                raise ValueError(f"{agent} 的路由中有未知的后端：{unknown}")
+
+        self.default = self.makeChatLLM(None)
+
+    def __call__(self, *args, **kwargs):
+        return self.default(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # model_name、provider、supports_delta 等属性与默认路由相同
+        default = self.__dict__.get("default")
+        if default is None:
+            raise AttributeError(name)
+        return getattr(default, name)
+
+    def for_agent(self, name):
+        return self.makeChatLLM(name)
+
+    def rank(self, allowed) -> list:
+        """按优先顺序排列可用的后端，冷却中的排在最后"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = [b for b in self.backends if allowed is None or b.name in allowed]
+            if self.prefer == "cost":
+                key = lambda b: (b.cost if b.cost is not None else float("inf"), b.score())
+            else:
+                key = lambda b: (b.score(), b.cost if b.cost is not None else 0)
+            ready = sorted((b for b in candidates if b.cooldown_until <= now), key=key)
+            cooling = sorted(
+                (b for b in candidates if b.cooldown_until > now),
+                key=lambda b: b.cooldown_until,
+            )
+            return ready + cooling
+
+    def begin(self, backend):
+        with self.lock:
+            backend.in_flight += 1
+            backend.calls += 1
+
+    def recordSuccess(self, backend, latency):
+        with self.lock:
+            backend.in_flight -= 1
+            backend.failures = 0
+            if backend.latency is None:
+                backend.latency = latency
+            else:
+                backend.latency += self.alpha * (latency - backend.latency)
+            backend.error_rate -= self.alpha * backend.error_rate
+
+    def recordFailure(self, backend, error):
+        with self.lock:
+            backend.in_flight -= 1
+            backend.errors += 1
+            backend.failures += 1
+            backend.error_rate += self.alpha * (1 - backend.error_rate)
+            if isinstance(error, RateLimitError) or backend.failures >= self.max_failures:
+                retry_after = getattr(error, "retry_after", None)
+                backend.cooldown_until = time.monotonic() + (retry_after or self.cooldown)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                b.name: {
+                    "calls": b.calls,
+                    "errors": b.errors,
+                    "latency": b.latency,
+                    "error_rate": b.error_rate,
+                    "in_flight": b.in_flight,
+                    "cooling": b.cooldown_until > time.monotonic(),
+                }
+                for b in self.backends
+            }
+
+    def makeChatLLM(self, agent):
+        allowed = self.routes.get(agent)
+        members = [b for b in self.backends if allowed is None or b.name in allowed]
+
+        def chatLLM(
+            messages: list,
+            temperature=None,
+            top_p=None,
+            max_tokens=None,
+            stream=False,
+            delta=False,
+        ) -> dict:
+            kwargs = {"messages": messages, "temperature": temperature, "top_p": top_p}
+            if max_tokens is not None:
+                kwargs["max_tokens"] = max_tokens
+            if delta:
+                kwargs["delta"] = True
+            if not stream:
+                last_error = None
+                for backend in self.rank(allowed):
+                    self.begin(backend)
+                    start = time.monotonic()
+                    try:
+                        resp = backend.chatLLM(**kwargs)
+                    except Exception as e:
+                        self.recordFailure(backend, e)
+                        last_error = e
+                        continue
+                    self.recordSuccess(backend, time.monotonic() - start)
+                    resp["backend"] = backend.name
+                    return resp
+                raise last_error
+            else:
+
+                def respGenerator():
+                    last_error = None
+                    for backend in self.rank(allowed):
+                        self.begin(backend)
+                        start = time.monotonic()
+                        started = False
+                        try:
+                            for resp in backend.chatLLM(**kwargs, stream=True):
+                                started = True
+                                resp["backend"] = backend.name
+                                yield resp
+                        except GeneratorExit:
+                            # 调用方提前结束接收
+                            self.recordSuccess(backend, time.monotonic() - start)
+                            raise
+                        except Exception as e:
+                            self.recordFailure(backend, e)
+                            # 已经输出了部分内容时不能换后端重来
+                            if started:
+                                raise
+                            last_error = e
+                            continue
+                        self.recordSuccess(backend, time.monotonic() - start)
+                        return
+                    raise last_error
+
+                return respGenerator()
+
+        chatLLM.model_name = "+".join(b.name for b in members)
+        chatLLM.provider = "router"
+        chatLLM.supports_delta = all(
+            getattr(b.chatLLM, "supports_delta", False) for b in members
+        )
+
+        return chatLLM
+
+
+def routerChatLLM(backends, routes=None, prefer="latency", **kwargs) -> ChatRouter:
+    """
+    由多个 chatLLM 组成的路由 chatLLM，见 ChatRouter
+
+    chatLLM = routerChatLLM(
+        [zhipuChatLLM("glm-4"), (deepseekChatLLM(), 1)],
+        routes={"MemoryMaker": ["deepseek:deepseek-chat"]},
+    )
+    """
+    return ChatRouter(backends, routes=routes, prefer=prefer, **kwargs)
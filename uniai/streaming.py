@@ -0,0 +1,93 @@
+def getField(obj, name):
+    """同时支持属性与 dict 形式的 usage"""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def cachedTokens(usage):
+    """
+    命中服务商前缀缓存的 prompt token 数，服务商没有返回时为 None
+    - DeepSeek：prompt_cache_hit_tokens
+    - OpenAI 兼容接口（智谱、通义千问等）：prompt_tokens_details.cached_tokens
+    """
+    cached = getField(usage, "prompt_cache_hit_tokens")
+    if cached is None:
+        cached = getField(getField(usage, "prompt_tokens_details"), "cached_tokens")
+    return cached
+
+
+def usageDict(usage):
+    """把 OpenAI 兼容接口的 usage 转换为 chatLLM 返回的 token 字段"""
+    if not usage:
+        return None
+    return {
+        "total_tokens": usage.total_tokens,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": cachedTokens(usage),
+    }
+
+
+def openaiPieces(responses):
+    """OpenAI 兼容接口的流式响应 -> (增量文本, usage)"""
+    for response in responses:
+        text = (response.choices[0].delta.content or "") if response.choices else ""
+        yield text, usageDict(getattr(response, "usage", None))
+
+
+def makeChunk(usage, **kwargs):
+    chunk = {
+        "total_tokens": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "cached_tokens": None,
+    }
+    chunk.update(usage or {})
+    chunk.update(kwargs)
+    return chunk
+
+
+def streamChunks(pieces, delta=False):
+    """
+    把 (增量文本, usage) 转换为 chatLLM 的流式输出
+    - delta 为 False：每次输出累积的完整内容 {"content": ...}
+    - delta 为 True：每次只输出 {"delta": 增量文本, "content": None}，结束时再输出一次
+      {"delta": "", "content": 完整内容} 与 token 用量，调用方处理每个分块的开销与已输出的长度无关
+    """
+    if not delta:
+        content = ""
+        for text, usage in pieces:
+            content += text
+            yield makeChunk(usage, content=content)
+        return
+
+    texts = []
+    last_usage = None
+    for text, usage in pieces:
+        last_usage = usage or last_usage
+        if text:
+            texts.append(text)
+            yield makeChunk(usage, delta=text, content=None)
+    yield makeChunk(last_usage, delta="", content="".join(texts))
+
+
+async def asyncStreamChunks(pieces, delta=False):
+    """streamChunks 的异步版本，pieces 为异步迭代器"""
+    if not delta:
+        content = ""
+        async for text, usage in pieces:
+            content += text
+            yield makeChunk(usage, content=content)
+        return
+
+    texts = []
+    last_usage = None
+    async for text, usage in pieces:
+        last_usage = usage or last_usage
+        if text:
+            texts.append(text)
+            yield makeChunk(usage, delta=text, content=None)
+    yield makeChunk(last_usage, delta="", content="".join(texts))
@@ -2,12 +2,18 @@ import os
 
 from zhipuai import ZhipuAI
 
+from .asyncAI import asyncChatLLM
+from .errors import iterResponses, wrapError
+from .streaming import openaiPieces, streamChunks, usageDict
+
 
 def zhipuChatLLM(model_name, api_key=None):
     """
     model_name 取值
     - glm-3-turbo"
     - glm-4
+
+    stream=True, delta=True 时只输出增量，最后输出一次完整内容，见 streaming.streamChunks
     """
     api_key = os.environ.get("ZHIPU_AI_API_KEY", api_key)
     client = ZhipuAI(api_key=api_key)
@@ -18,45 +24,57 @@ def zhipuChatLLM(model_name, api_key=None):
         top_p=None,
         max_tokens=None,
         stream=False,
+        delta=False,
     ) -> dict:
         if not stream:
-            response = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-            )
+            try:
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                )
+            except Exception as e:
+                raise wrapError(e)
             return {
                 "content": response.choices[0].message.content,
-                "total_tokens": response.usage.total_tokens,
+                **usageDict(response.usage),
             }
         else:
-            responses = client.chat.completions.create(
-                model=model_name,
-                messages=messages,
-                temperature=temperature,
-                top_p=top_p,
-                max_tokens=max_tokens,
-                stream=True,
-            )
-
-            def respGenerator():
-                content = ""
-                for response in responses:
-                    delta = response.choices[0].delta.content
-                    content += delta
-
-                    if response.usage:
-                        total_tokens = response.usage.total_tokens
-                    else:
-                        total_tokens = None
-
-                    yield {
-                        "content": content,
-                        "total_tokens": total_tokens,
-                    }
-
-            return respGenerator()
+            try:
+                responses = client.chat.completions.create(
+                    model=model_name,
+                    messages=messages,
+                    temperature=temperature,
+                    top_p=top_p,
+                    max_tokens=max_tokens,
+                    stream=True,
+                )
+            except Exception as e:
+                raise wrapError(e)
+
+            return streamChunks(openaiPieces(iterResponses(responses)), delta)
+
+    chatLLM.model_name = model_name
+    chatLLM.provider = "zhipu"
+    chatLLM.supports_delta = True
 
     return chatLLM
+
+
+def zhipuAsyncChatLLM(model_name, api_key=None, max_concurrency=8):
+    """
+    zhipuChatLLM 的异步版本，参数与返回值相同，调用时需要 await
+    - max_concurrency：同时进行的请求数上限
+
+    流式输出：async for resp in await chatLLM(messages, stream=True)
+    """
+    api_key = os.environ.get("ZHIPU_AI_API_KEY", api_key)
+    return asyncChatLLM(
+        model_name,
+        api_key=api_key,
+        provider="zhipu",
+        base_url="https://open.bigmodel.cn/api/paas/v4/",
+        max_concurrency=max_concurrency,
+    )